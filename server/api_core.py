@@ -0,0 +1,181 @@
+"""
+Framework-neutral route definitions shared by the Flask and ASGI servers
+
+API handlers are written once, as generator functions that yield every
+MongoDB call:
+
+    @routes.route('/posts/<post_id>', methods=['GET'])
+    def get_post(post_id):
+        post = yield get_database().posts.find_one({'id': post_id})
+        ...
+        return jsonify(post), 200
+
+With pymongo the call has already run when it is yielded, and run_sync()
+just sends the result back. With motor the yielded value is awaitable and
+run_async() awaits it, throwing any exception back into the handler at the
+yield, so try/except around database calls behaves the same in both modes.
+Helpers that touch MongoDB are generators too and are called with
+`yield from`.
+
+Handlers read the request through the `request` proxy in this module and
+return (body, status) or (body, status, headers); bodies are the bytes
+produced by jsonify().
+"""
+import contextvars
+import inspect
+
+from flask import Blueprint, Response, request as flask_request
+
+from database import get_database as get_sync_database
+from json_encoder import dumps
+
+JSON_MIMETYPE = 'application/json'
+
+
+class RequestData:
+    """The parts of a request handlers use, captured by the serving adapter"""
+    __slots__ = ('args', 'json', 'headers', 'full_path', 'method')
+
+    def __init__(self, args, json, headers, full_path, method):
+        self.args = args
+        self.json = json
+        self.headers = headers
+        self.full_path = full_path
+        self.method = method
+
+
+_current_request = contextvars.ContextVar('api_request')
+
+
+class _RequestProxy:
+    def __getattr__(self, name):
+        try:
+            return getattr(_current_request.get(), name)
+        except LookupError:
+            raise RuntimeError('No API request is being handled')
+
+
+request = _RequestProxy()
+
+
+_database_getter = get_sync_database
+
+
+def set_database_getter(getter):
+    """Point handlers at another database object (the ASGI server's motor database)"""
+    global _database_getter
+    _database_getter = getter
+
+
+def get_database():
+    """The database for the current serving mode: pymongo, or motor under ASGI"""
+    return _database_getter()
+
+
+def to_list(cursor):
+    """All documents of a cursor; yield the result (awaitable under motor)"""
+    if hasattr(cursor, 'to_list'):
+        return cursor.to_list(length=None)
+    return list(cursor)
+
+
+def find_one(collection, *args, **kwargs):
+    """collection.find_one() as a generator, for helpers that take a query to run"""
+    return (yield collection.find_one(*args, **kwargs))
+
+
+def jsonify(obj):
+    """Encode a response body; MongoDB documents can be passed as they are"""
+    return dumps(obj)
+
+
+def normalize_result(result):
+    """(body, status, headers) from a handler's return value"""
+    if len(result) == 2:
+        body, status = result
+        return body, status, {}
+    return result
+
+
+def run_sync(result):
+    """Drive a handler generator whose yielded values are already results"""
+    if not inspect.isgenerator(result):
+        return result
+    value = None
+    try:
+        while True:
+            value = result.send(value)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_async(result):
+    """Drive a handler generator, awaiting each yielded database call"""
+    if not inspect.isgenerator(result):
+        return result
+    value, error = None, None
+    while True:
+        try:
+            step = result.throw(error) if error is not None else result.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value, error = None, None
+        try:
+            value = await step if inspect.isawaitable(step) else step
+        except Exception as e:
+            error = e
+
+
+def call_sync(handler, data, kwargs):
+    """Run a handler for the request described by data (Flask)"""
+    token = _current_request.set(data)
+    try:
+        return normalize_result(run_sync(handler(**kwargs)))
+    finally:
+        _current_request.reset(token)
+
+
+async def call_async(handler, data, kwargs):
+    """Run a handler for the request described by data (ASGI)"""
+    token = _current_request.set(data)
+    try:
+        return normalize_result(await run_async(handler(**kwargs)))
+    finally:
+        _current_request.reset(token)
+
+
+class ApiRoutes:
+    """Route table of generator handlers, turned into a blueprint per framework"""
+
+    def __init__(self):
+        self.routes = []
+
+    def route(self, rule, methods=('GET',)):
+        def decorator(handler):
+            self.routes.append((rule, list(methods), handler))
+            return handler
+        return decorator
+
+
+def _flask_view(handler):
+    def view(**kwargs):
+        data = RequestData(
+            args=flask_request.args,
+            json=flask_request.get_json(silent=True) if flask_request.method != 'GET' else None,
+            headers=flask_request.headers,
+            full_path=flask_request.full_path,
+            method=flask_request.method
+        )
+        body, status, headers = call_sync(handler, data, kwargs)
+        return Response(body, status=status, headers=headers, mimetype=JSON_MIMETYPE)
+    view.__name__ = handler.__name__
+    view.__doc__ = handler.__doc__
+    return view
+
+
+def flask_blueprint(routes, name, import_name, **kwargs):
+    """Build a Flask blueprint serving every route in routes"""
+    blueprint = Blueprint(name, import_name, **kwargs)
+    for rule, methods, handler in routes.routes:
+        blueprint.add_url_rule(rule, handler.__name__, _flask_view(handler), methods=methods)
+    return blueprint
@@ -1,45 +1,125 @@
 """
 API routes for FarmSphere backend
+
+Handlers are api_core generators that yield each MongoDB call, so the same
+code serves the Flask blueprint below and the ASGI server in asgi_app.py.
 """
-from flask import Blueprint, request, jsonify
 from datetime import datetime
-from bson import ObjectId
-from database import get_database
+from pymongo.errors import DuplicateKeyError
+from api_core import ApiRoutes, request, get_database, to_list, find_one, jsonify, flask_blueprint
+from database import get_database as get_sync_database
 from models import (
     User, Post, Comment, Activity, ChatMessage, 
     CropHealth, PostLike, SavedPost
 )
+from metrics import instrument
+from pagination import paginate, paginate_pipeline, CachedCount, InvalidCursorError
+from projections import parse_fields, InvalidFieldsError
+from response_cache import ResponseCache
+from bulk_writes import bulk_insert, parse_client_timestamp, InvalidItemError
+from cascade_deletes import CascadeDeleteQueue, LIVE, TOMBSTONED
+from chat_events import ChatBroker, resume_cursor
+from post_search import search, parse_search_args, InvalidSearchError
+from counter_buffer import CounterBuffer
+from disease_rollups import ROLLUP_KEY, record as record_rollups, prevalence, parse_range
+from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Create Blueprint
-api = Blueprint('api', __name__, url_prefix='/api')
-
-# Helper function to convert ObjectId to string
-def serialize_doc(doc):
-    """Convert MongoDB document to JSON-serializable format"""
-    if doc is None:
-        return None
-    if isinstance(doc, dict):
-        result = {}
-        for key, value in doc.items():
-            if isinstance(value, ObjectId):
-                result[key] = str(value)
-            elif isinstance(value, datetime):
-                result[key] = value.isoformat()
-            elif isinstance(value, dict):
-                result[key] = serialize_doc(value)
-            elif isinstance(value, list):
-                result[key] = [serialize_doc(item) for item in value]
-            else:
-                result[key] = value
-        return result
+# Route table; the Flask blueprint is built from it at the end of this module
+routes = ApiRoutes()
+
+def get_page_args(default_limit):
+    """Read page, limit and cursor query parameters"""
+    page = max(1, int(request.args.get('page', 1)))
+    limit = int(request.args.get('limit', default_limit))
+    limit = max(1, min(limit, Config.MAX_PAGE_SIZE))
+    return page, limit, request.args.get('cursor')
+
+def get_projection(collection, sort_field=None):
+    """Projection for the fields= query parameter (None returns whole documents)"""
+    return parse_fields(collection, request.args.get('fields'), sort_field)
+
+def get_bulk_items():
+    """Items of a bulk upload: a JSON array, or an object with an 'items' array"""
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValueError('Request body must be a non-empty array of items')
+    if len(items) > Config.BULK_MAX_ITEMS:
+        raise ValueError(f"At most {Config.BULK_MAX_ITEMS} items per request")
+    return items
+
+def set_client_timestamp(doc, item, *fields):
+    """Keep the time an offline item was recorded on the device, if sent"""
+    timestamp = parse_client_timestamp(item.get('timestamp'))
+    if timestamp is not None:
+        for field in fields:
+            doc[field] = timestamp
     return doc
 
+# Posts total shown in the feed; an estimate refreshed periodically instead
+# of a full count on every page view. Tombstones awaiting their cascade are
+# subtracted through the sparse deletedAt index
+posts_total = CachedCount(
+    lambda: get_database().posts, ttl=Config.POSTS_COUNT_TTL, exclude=TOMBSTONED
+)
+
+# Feed, post and comment reads; write routes below invalidate the tags they touch
+response_cache = ResponseCache(maxsize=Config.RESPONSE_CACHE_SIZE, ttl=Config.RESPONSE_CACHE_TTL)
+
+# Popular searches; only creating or deleting a post invalidates them, so
+# counters in results may lag by up to SEARCH_CACHE_TTL seconds
+search_cache = ResponseCache(maxsize=Config.SEARCH_CACHE_SIZE, ttl=Config.SEARCH_CACHE_TTL)
+
+# Like and comment counters, written to posts in coalesced batches; the
+# serving process starts the flusher
+post_counters = CounterBuffer(
+    lambda: get_sync_database().posts,
+    flush_interval=Config.COUNTER_FLUSH_INTERVAL,
+    max_pending=Config.COUNTER_FLUSH_MAX_PENDING
+)
+
+# Disease prevalence counts per (location, day, label), upserted in batches
+rollup_counters = CounterBuffer(
+    lambda: get_sync_database().disease_rollups,
+    key_field=ROLLUP_KEY,
+    flush_interval=Config.ROLLUP_FLUSH_INTERVAL,
+    max_pending=Config.COUNTER_FLUSH_MAX_PENDING,
+    upsert=True,
+    name='disease_rollups'
+)
+
+# Removes deleted posts' comments, likes and saves in the background; the
+# serving process starts it (see plant_disease_api.py and asgi_app.py)
+post_cascade = CascadeDeleteQueue(
+    get_sync_database,
+    chunk_size=Config.CASCADE_CHUNK_SIZE,
+    max_queue=Config.CASCADE_QUEUE_SIZE,
+    max_retries=Config.CASCADE_MAX_RETRIES,
+    sweep_interval=Config.CASCADE_SWEEP_INTERVAL,
+    tombstone_grace=Config.CASCADE_TOMBSTONE_GRACE
+)
+
+def is_tombstoned(post_id):
+    """Whether post_id was deleted and its cascade has not finished yet"""
+    post = yield get_database().posts.find_one({'id': post_id, 'deletedAt': {'$ne': None}}, {'_id': 1})
+    return post is not None
+
+# New chat messages for the event streams served by asgi_app.py
+chat_broker = ChatBroker(
+    source=Config.CHAT_STREAM_SOURCE,
+    queue_size=Config.CHAT_STREAM_QUEUE_SIZE,
+    max_connections=Config.CHAT_STREAM_MAX_CONNECTIONS
+)
+
+# Attempts for like/save toggles racing a concurrent toggle by the same user
+TOGGLE_RETRIES = 3
+
 # ==================== USER ROUTES ====================
 
-@api.route('/users', methods=['POST'])
+@routes.route('/users', methods=['POST'])
 def create_user():
     """Create a new user"""
     try:
@@ -56,28 +136,28 @@ def create_user():
         )
         
         # Check if user already exists
-        existing = db.users.find_one({'userId': user_id})
+        existing = yield db.users.find_one({'userId': user_id})
         if existing:
-            return jsonify(serialize_doc(existing)), 200
+            return jsonify(existing), 200
         
-        db.users.insert_one(user_doc)
-        return jsonify(serialize_doc(user_doc)), 201
+        yield db.users.insert_one(user_doc)
+        return jsonify(user_doc), 201
         
     except Exception as e:
         logger.error(f"Error creating user: {e}")
         return jsonify({'error': str(e)}), 500
 
-@api.route('/users/<user_id>', methods=['GET'])
+@routes.route('/users/<user_id>', methods=['GET'])
 def get_user(user_id):
     """Get user by ID"""
     try:
         db = get_database()
-        user = db.users.find_one({'userId': user_id})
+        user = yield db.users.find_one({'userId': user_id})
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify(serialize_doc(user)), 200
+        return jsonify(user), 200
         
     except Exception as e:
         logger.error(f"Error getting user: {e}")
@@ -85,30 +165,36 @@ def get_user(user_id):
 
 # ==================== POST ROUTES ====================
 
-@api.route('/posts', methods=['GET'])
+@routes.route('/posts', methods=['GET'])
+@response_cache.cached('feed')
 def get_posts():
     """Get all posts (with pagination)"""
     try:
         db = get_database()
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 20))
-        skip = (page - 1) * limit
+        page, limit, cursor = get_page_args(20)
+        
+        projection = get_projection('posts', 'timestamp')
         
-        posts = list(db.posts.find().sort('timestamp', -1).skip(skip).limit(limit))
-        total = db.posts.count_documents({})
+        posts, next_cursor = yield from post_counters.read(lambda: paginate(
+            db.posts, LIVE, 'timestamp', -1, limit, cursor=cursor, page=page, projection=projection
+        ), docs=lambda page: page[0])
+        total = yield from posts_total.get()
         
         return jsonify({
-            'posts': [serialize_doc(post) for post in posts],
+            'posts': posts,
             'total': total,
             'page': page,
-            'limit': limit
+            'limit': limit,
+            'next': next_cursor
         }), 200
         
+    except (InvalidCursorError, InvalidFieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting posts: {e}")
         return jsonify({'error': str(e)}), 500
 
-@api.route('/posts', methods=['POST'])
+@routes.route('/posts', methods=['POST'])
 def create_post():
     """Create a new post"""
     try:
@@ -126,43 +212,76 @@ def create_post():
             image=data.get('image')
         )
         
-        db.posts.insert_one(post_doc)
-        return jsonify(serialize_doc(post_doc)), 201
+        yield db.posts.insert_one(post_doc)
+        posts_total.invalidate()
+        response_cache.invalidate('feed')
+        search_cache.invalidate('search')
+        return jsonify(post_doc), 201
         
     except Exception as e:
         logger.error(f"Error creating post: {e}")
         return jsonify({'error': str(e)}), 500
 
-@api.route('/posts/<post_id>', methods=['GET'])
+@routes.route('/posts/search', methods=['GET'])
+@search_cache.cached('search')
+def search_posts():
+    """Search posts by text (ranked by relevance) and/or tags, optionally by location"""
+    try:
+        db = get_database()
+        q, tags, location = parse_search_args(request.args)
+        _, limit, cursor = get_page_args(20)
+        
+        projection = get_projection('posts', 'score' if q else 'timestamp')
+        
+        posts, next_cursor = yield from post_counters.read(lambda: search(
+            db.posts, q, tags, location, limit, cursor=cursor, projection=projection
+        ), docs=lambda page: page[0])
+        
+        return jsonify({
+            'posts': posts,
+            'limit': limit,
+            'next': next_cursor
+        }), 200
+        
+    except (InvalidSearchError, InvalidCursorError, InvalidFieldsError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error searching posts: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@routes.route('/posts/<post_id>', methods=['GET'])
+@response_cache.cached('post:{post_id}')
 def get_post(post_id):
     """Get a specific post"""
     try:
         db = get_database()
-        post = db.posts.find_one({'id': post_id})
+        post = yield from post_counters.read(lambda: find_one(db.posts, dict(LIVE, id=post_id)))
         
         if not post:
             return jsonify({'error': 'Post not found'}), 404
         
-        return jsonify(serialize_doc(post)), 200
+        return jsonify(post), 200
         
     except Exception as e:
         logger.error(f"Error getting post: {e}")
         return jsonify({'error': str(e)}), 500
 
-@api.route('/posts/<post_id>', methods=['DELETE'])
+@routes.route('/posts/<post_id>', methods=['DELETE'])
 def delete_post(post_id):
     """Delete a post"""
     try:
         db = get_database()
-        result = db.posts.delete_one({'id': post_id})
+        # The tombstone hides the post from every read route at once
+        result = yield db.posts.update_one(dict(LIVE, id=post_id), {'$set': {'deletedAt': datetime.utcnow()}})
         
-        if result.deleted_count == 0:
+        if result.matched_count == 0:
             return jsonify({'error': 'Post not found'}), 404
+        posts_total.invalidate()
+        response_cache.invalidate('feed', f'post:{post_id}')
+        search_cache.invalidate('search')
         
-        # Also delete related comments and likes
-        db.comments.delete_many({'postId': post_id})
-        db.post_likes.delete_many({'postId': post_id})
-        db.saved_posts.delete_many({'postId': post_id})
+        # Comments, likes and saves are removed in the background
+        post_cascade.enqueue(post_id)
         
         return jsonify({'message': 'Post deleted successfully'}), 200
         
@@ -172,22 +291,28 @@ def delete_post(post_id):
 
 # ==================== COMMENT ROUTES ====================
 
-@api.route('/posts/<post_id>/comments', methods=['GET'])
+@routes.route('/posts/<post_id>/comments', methods=['GET'])
+@response_cache.cached('post:{post_id}')
 def get_comments(post_id):
     """Get comments for a post"""
     try:
         db = get_database()
-        comments = list(db.comments.find({'postId': post_id}).sort('timestamp', 1))
+        projection = get_projection('comments', 'timestamp')
+        if (yield from is_tombstoned(post_id)):
+            return jsonify({'comments': []}), 200
+        comments = yield to_list(db.comments.find({'postId': post_id}, projection).sort('timestamp', 1))
         
         return jsonify({
-            'comments': [serialize_doc(comment) for comment in comments]
+            'comments': comments
         }), 200
         
+    except InvalidFieldsError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting comments: {e}")
         return jsonify({'error': str(e)}), 500
 
-@api.route('/posts/<post_id>/comments', methods=['POST'])
+@routes.route('/posts/<post_id>/comments', methods=['POST'])
 def create_comment(post_id):
     """Create a comment on a post"""
     try:
@@ -195,7 +320,7 @@ def create_comment(post_id):
         db = get_database()
         
         # Check if post exists
-        post = db.posts.find_one({'id': post_id})
+        post = yield db.posts.find_one(dict(LIVE, id=post_id), {'_id': 1})
         if not post:
             return jsonify({'error': 'Post not found'}), 404
         
@@ -208,15 +333,13 @@ def create_comment(post_id):
             content=data.get('content', '')
         )
         
-        db.comments.insert_one(comment_doc)
+        yield db.comments.insert_one(comment_doc)
         
-        # Update post comment count
-        db.posts.update_one(
-            {'id': post_id},
-            {'$inc': {'comments': 1}, '$set': {'updatedAt': datetime.utcnow()}}
-        )
+        # Counted in the next coalesced counter write
+        post_counters.add(post_id, 'comments', 1)
+        response_cache.invalidate('feed', f'post:{post_id}')
         
-        return jsonify(serialize_doc(comment_doc)), 201
+        return jsonify(comment_doc), 201
         
     except Exception as e:
         logger.error(f"Error creating comment: {e}")
@@ -224,7 +347,7 @@ def create_comment(post_id):
 
 # ==================== LIKE ROUTES ====================
 
-@api.route('/posts/<post_id>/like', methods=['POST'])
+@routes.route('/posts/<post_id>/like', methods=['POST'])
 def toggle_like(post_id):
     """Toggle like on a post"""
     try:
@@ -235,46 +358,53 @@ def toggle_like(post_id):
             return jsonify({'error': 'userId is required'}), 400
         
         db = get_database()
+        like_filter = {'postId': post_id, 'userId': user_id}
+        
+        for _ in range(TOGGLE_RETRIES):
+            # Deleting both checks for and removes an existing like in one round trip
+            if (yield db.post_likes.delete_one(like_filter)).deleted_count:
+                liked, delta = False, -1
+                break
+            try:
+                # The unique (postId, userId) index rejects a concurrent duplicate
+                yield db.post_likes.insert_one(PostLike.create_like(post_id, user_id))
+                liked, delta = True, 1
+                break
+            except DuplicateKeyError:
+                # A concurrent tap liked it first; this tap unlikes it
+                continue
+        else:
+            return jsonify({'error': 'Too many concurrent updates, try again'}), 409
         
-        # Check if post exists
-        post = db.posts.find_one({'id': post_id})
-        if not post:
+        post = yield from post_counters.read(
+            lambda: find_one(db.posts, dict(LIVE, id=post_id), {'id': 1, 'likes': 1})
+        )
+        if post is None:
+            if liked:
+                yield db.post_likes.delete_one(like_filter)
             return jsonify({'error': 'Post not found'}), 404
+        # Hot posts take many likes per second; the counter write is coalesced
+        post_counters.add(post_id, 'likes', delta)
+        post['likes'] = post.get('likes', 0) + delta
+        response_cache.invalidate('feed', f'post:{post_id}')
         
-        # Check if already liked
-        existing_like = db.post_likes.find_one({'postId': post_id, 'userId': user_id})
-        
-        if existing_like:
-            # Unlike
-            db.post_likes.delete_one({'postId': post_id, 'userId': user_id})
-            db.posts.update_one(
-                {'id': post_id},
-                {'$inc': {'likes': -1}, '$set': {'updatedAt': datetime.utcnow()}}
-            )
-            return jsonify({'liked': False, 'likes': post.get('likes', 0) - 1}), 200
-        else:
-            # Like
-            like_doc = PostLike.create_like(post_id, user_id)
-            db.post_likes.insert_one(like_doc)
-            db.posts.update_one(
-                {'id': post_id},
-                {'$inc': {'likes': 1}, '$set': {'updatedAt': datetime.utcnow()}}
-            )
-            return jsonify({'liked': True, 'likes': post.get('likes', 0) + 1}), 200
+        return jsonify({'liked': liked, 'likes': post['likes']}), 200
         
     except Exception as e:
         logger.error(f"Error toggling like: {e}")
         return jsonify({'error': str(e)}), 500
 
-@api.route('/posts/<post_id>/likes', methods=['GET'])
+@routes.route('/posts/<post_id>/likes', methods=['GET'])
 def get_post_likes(post_id):
     """Get users who liked a post"""
     try:
         db = get_database()
-        likes = list(db.post_likes.find({'postId': post_id}))
+        if (yield from is_tombstoned(post_id)):
+            return jsonify({'likes': []}), 200
+        likes = yield to_list(db.post_likes.find({'postId': post_id}))
         
         return jsonify({
-            'likes': [serialize_doc(like) for like in likes]
+            'likes': likes
         }), 200
         
     except Exception as e:
@@ -283,7 +413,7 @@ def get_post_likes(post_id):
 
 # ==================== SAVE POST ROUTES ====================
 
-@api.route('/posts/<post_id>/save', methods=['POST'])
+@routes.route('/posts/<post_id>/save', methods=['POST'])
 def toggle_save(post_id):
     """Toggle save on a post"""
     try:
@@ -294,75 +424,98 @@ def toggle_save(post_id):
             return jsonify({'error': 'userId is required'}), 400
         
         db = get_database()
-        
-        # Check if post exists
-        post = db.posts.find_one({'id': post_id})
-        if not post:
-            return jsonify({'error': 'Post not found'}), 404
-        
-        # Check if already saved
-        existing_save = db.saved_posts.find_one({'postId': post_id, 'userId': user_id})
-        
-        if existing_save:
-            # Unsave
-            db.saved_posts.delete_one({'postId': post_id, 'userId': user_id})
-            return jsonify({'saved': False}), 200
-        else:
-            # Save
-            saved_doc = SavedPost.create_saved_post(post_id, user_id)
-            db.saved_posts.insert_one(saved_doc)
-            return jsonify({'saved': True}), 200
+        save_filter = {'postId': post_id, 'userId': user_id}
+        
+        for _ in range(TOGGLE_RETRIES):
+            # Unsave: deleting both checks for and removes an existing save
+            if (yield db.saved_posts.delete_one(save_filter)).deleted_count:
+                return jsonify({'saved': False}), 200
+            
+            # Save: only posts that exist can be saved
+            if (yield db.posts.find_one(dict(LIVE, id=post_id), {'_id': 1})) is None:
+                return jsonify({'error': 'Post not found'}), 404
+            try:
+                yield db.saved_posts.insert_one(SavedPost.create_saved_post(post_id, user_id))
+                return jsonify({'saved': True}), 200
+            except DuplicateKeyError:
+                # A concurrent tap saved it first; this tap unsaves it
+                continue
+        
+        return jsonify({'error': 'Too many concurrent updates, try again'}), 409
         
     except Exception as e:
         logger.error(f"Error toggling save: {e}")
         return jsonify({'error': str(e)}), 500
 
-@api.route('/users/<user_id>/saved-posts', methods=['GET'])
+@routes.route('/users/<user_id>/saved-posts', methods=['GET'])
 def get_saved_posts(user_id):
-    """Get saved posts for a user"""
+    """Get saved posts for a user, most recently saved first"""
     try:
         db = get_database()
-        saved_posts = list(db.saved_posts.find({'userId': user_id}).sort('createdAt', -1))
+        page, limit, cursor = get_page_args(20)
         
-        # Get full post details
-        post_ids = [sp['postId'] for sp in saved_posts]
-        posts = list(db.posts.find({'id': {'$in': post_ids}}))
+        projection = get_projection('posts')
+        if projection is None:
+            post_fields = {'post': 1}
+        else:
+            # Same fields find() would return, nested under the joined post
+            post_fields = {f'post.{field}': value for field, value in projection.items()}
+            post_fields.setdefault('post._id', 1)
+            # Needed to leave out posts whose delete is still cascading
+            post_fields.setdefault('post.deletedAt', 1)
+        
+        # One round trip: page through the saves, then join only that page's posts
+        saves, next_cursor = yield from post_counters.read(lambda: paginate_pipeline(
+            db.saved_posts, {'userId': user_id}, 'createdAt', -1, limit, cursor=cursor, page=page,
+            stages=[
+                {'$lookup': {'from': 'posts', 'localField': 'postId', 'foreignField': 'id', 'as': 'post'}},
+                {'$unwind': {'path': '$post', 'preserveNullAndEmptyArrays': True}},
+                {'$project': dict(post_fields, createdAt=1)},
+            ]
+        ), docs=lambda page: [save['post'] for save in page[0] if 'post' in save])
+        
+        # Saves of deleted posts have nothing to join, or join a tombstone
+        posts = [save['post'] for save in saves if 'post' in save and save['post'].get('deletedAt') is None]
         
         return jsonify({
-            'posts': [serialize_doc(post) for post in posts]
+            'posts': posts,
+            'next': next_cursor
         }), 200
         
+    except (InvalidCursorError, InvalidFieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting saved posts: {e}")
         return jsonify({'error': str(e)}), 500
 
 # ==================== ACTIVITY ROUTES ====================
 
-@api.route('/users/<user_id>/activities', methods=['GET'])
+@routes.route('/users/<user_id>/activities', methods=['GET'])
 def get_activities(user_id):
     """Get activities for a user"""
     try:
         db = get_database()
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 20))
-        skip = (page - 1) * limit
-        
-        activities = list(
-            db.activities.find({'userId': user_id})
-            .sort('timestamp', -1)
-            .skip(skip)
-            .limit(limit)
+        page, limit, cursor = get_page_args(20)
+        
+        projection = get_projection('activities', 'timestamp')
+        
+        activities, next_cursor = yield from paginate(
+            db.activities, {'userId': user_id}, 'timestamp', -1, limit,
+            cursor=cursor, page=page, projection=projection
         )
         
         return jsonify({
-            'activities': [serialize_doc(activity) for activity in activities]
+            'activities': activities,
+            'next': next_cursor
         }), 200
         
+    except (InvalidCursorError, InvalidFieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting activities: {e}")
         return jsonify({'error': str(e)}), 500
 
-@api.route('/users/<user_id>/activities', methods=['POST'])
+@routes.route('/users/<user_id>/activities', methods=['POST'])
 def create_activity(user_id):
     """Create a new activity"""
     try:
@@ -378,40 +531,74 @@ def create_activity(user_id):
             notes=data.get('notes', '')
         )
         
-        db.activities.insert_one(activity_doc)
-        return jsonify(serialize_doc(activity_doc)), 201
+        try:
+            yield db.activities.insert_one(activity_doc)
+        except DuplicateKeyError:
+            # Replay of an upload that already succeeded
+            existing = yield db.activities.find_one({'userId': user_id, 'id': activity_id})
+            return jsonify(existing), 200
+        return jsonify(activity_doc), 201
         
     except Exception as e:
         logger.error(f"Error creating activity: {e}")
         return jsonify({'error': str(e)}), 500
 
+@routes.route('/users/<user_id>/activities/bulk', methods=['POST'])
+def create_activities_bulk(user_id):
+    """Create many activities at once (offline sync); items need client ids"""
+    try:
+        items = get_bulk_items()
+        db = get_database()
+        
+        def build(item):
+            activity_doc = Activity.create_activity(
+                activity_id=item['id'],
+                user_id=user_id,
+                activity_type=item.get('type', ''),
+                crop=item.get('crop', ''),
+                notes=item.get('notes', '')
+            )
+            return set_client_timestamp(activity_doc, item, 'date', 'timestamp')
+        
+        results, summary = yield from bulk_insert(db.activities, items, build)
+        return jsonify({'results': results, 'summary': summary}), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error creating activities in bulk: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # ==================== CHAT ROUTES ====================
 
-@api.route('/chats/<chat_id>/messages', methods=['GET'])
+@routes.route('/chats/<chat_id>/messages', methods=['GET'])
 def get_chat_messages(chat_id):
     """Get messages for a chat"""
     try:
         db = get_database()
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
-        skip = (page - 1) * limit
-        
-        messages = list(
-            db.chat_messages.find({'chatId': chat_id})
-            .sort('timestamp', 1)
-            .skip(skip)
-            .limit(limit)
+        page, limit, cursor = get_page_args(50)
+        
+        projection = get_projection('chat_messages', 'timestamp')
+        
+        messages, next_cursor = yield from paginate(
+            db.chat_messages, {'chatId': chat_id}, 'timestamp', 1, limit,
+            cursor=cursor, page=page, projection=projection
         )
         
         return jsonify({
-            'messages': [serialize_doc(message) for message in messages]
+            'messages': messages,
+            'next': next_cursor,
+            # Set even on the last page, to open the stream from
+            'resume': resume_cursor(messages, cursor)
         }), 200
         
+    except (InvalidCursorError, InvalidFieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting chat messages: {e}")
         return jsonify({'error': str(e)}), 500
 
-@api.route('/chats/<chat_id>/messages', methods=['POST'])
+@routes.route('/chats/<chat_id>/messages', methods=['POST'])
 def create_chat_message(chat_id):
     """Create a chat message"""
     try:
@@ -427,40 +614,80 @@ def create_chat_message(chat_id):
             content=data.get('content', '')
         )
         
-        db.chat_messages.insert_one(message_doc)
-        return jsonify(serialize_doc(message_doc)), 201
+        try:
+            yield db.chat_messages.insert_one(message_doc)
+        except DuplicateKeyError:
+            # Replay of an upload that already succeeded
+            existing = yield db.chat_messages.find_one({'chatId': chat_id, 'id': message_id})
+            return jsonify(existing), 200
+        chat_broker.publish(message_doc)
+        return jsonify(message_doc), 201
         
     except Exception as e:
         logger.error(f"Error creating chat message: {e}")
         return jsonify({'error': str(e)}), 500
 
+@routes.route('/chats/<chat_id>/messages/bulk', methods=['POST'])
+def create_chat_messages_bulk(chat_id):
+    """Create many chat messages at once (offline sync); items need client ids"""
+    try:
+        items = get_bulk_items()
+        db = get_database()
+        built = []
+        
+        def build(item):
+            message_doc = ChatMessage.create_message(
+                message_id=item['id'],
+                chat_id=chat_id,
+                user_id=item.get('userId', ''),
+                user_name=item.get('userName', 'User'),
+                content=item.get('content', '')
+            )
+            # Only documents bulk_insert will write; a rejected item may share a later one's id
+            built.append(set_client_timestamp(message_doc, item, 'timestamp'))
+            return message_doc
+        
+        results, summary = yield from bulk_insert(db.chat_messages, items, build)
+        created = {result['id'] for result in results if result['status'] == 'created'}
+        for message_doc in built:
+            if message_doc['id'] in created:
+                chat_broker.publish(message_doc)
+        return jsonify({'results': results, 'summary': summary}), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error creating chat messages in bulk: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # ==================== CROP HEALTH ROUTES ====================
 
-@api.route('/users/<user_id>/crop-health', methods=['GET'])
+@routes.route('/users/<user_id>/crop-health', methods=['GET'])
 def get_crop_health_history(user_id):
     """Get crop health diagnosis history for a user"""
     try:
         db = get_database()
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 20))
-        skip = (page - 1) * limit
-        
-        diagnoses = list(
-            db.crop_health.find({'userId': user_id})
-            .sort('timestamp', -1)
-            .skip(skip)
-            .limit(limit)
+        page, limit, cursor = get_page_args(20)
+        
+        projection = get_projection('crop_health', 'timestamp')
+        
+        diagnoses, next_cursor = yield from paginate(
+            db.crop_health, {'userId': user_id}, 'timestamp', -1, limit,
+            cursor=cursor, page=page, projection=projection
         )
         
         return jsonify({
-            'diagnoses': [serialize_doc(diagnosis) for diagnosis in diagnoses]
+            'diagnoses': diagnoses,
+            'next': next_cursor
         }), 200
         
+    except (InvalidCursorError, InvalidFieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting crop health history: {e}")
         return jsonify({'error': str(e)}), 500
 
-@api.route('/users/<user_id>/crop-health', methods=['POST'])
+@routes.route('/users/<user_id>/crop-health', methods=['POST'])
 def create_crop_health_diagnosis(user_id):
     """Save a crop health diagnosis"""
     try:
@@ -476,10 +703,79 @@ def create_crop_health_diagnosis(user_id):
             location=data.get('location')
         )
         
-        db.crop_health.insert_one(diagnosis_doc)
-        return jsonify(serialize_doc(diagnosis_doc)), 201
+        try:
+            yield db.crop_health.insert_one(diagnosis_doc)
+        except DuplicateKeyError:
+            # Replay of an upload that already succeeded
+            existing = yield db.crop_health.find_one({'userId': user_id, 'id': diagnosis_id})
+            return jsonify(existing), 200
+        record_rollups(rollup_counters, [diagnosis_doc])
+        return jsonify(diagnosis_doc), 201
         
     except Exception as e:
         logger.error(f"Error creating crop health diagnosis: {e}")
         return jsonify({'error': str(e)}), 500
 
+@routes.route('/users/<user_id>/crop-health/bulk', methods=['POST'])
+def create_crop_health_bulk(user_id):
+    """Save many diagnoses at once (offline sync); items need client ids"""
+    try:
+        items = get_bulk_items()
+        db = get_database()
+        built = []
+        
+        def build(item):
+            results = item.get('results', [])
+            if not isinstance(results, list):
+                raise InvalidItemError('results must be a list')
+            diagnosis_doc = CropHealth.create_diagnosis(
+                diagnosis_id=item['id'],
+                user_id=user_id,
+                image_url=item.get('imageUrl'),
+                results=results,
+                location=item.get('location')
+            )
+            # Only documents bulk_insert will write; a rejected item may share a later one's id
+            built.append(set_client_timestamp(diagnosis_doc, item, 'timestamp'))
+            return diagnosis_doc
+        
+        results, summary = yield from bulk_insert(db.crop_health, items, build)
+        created = {result['id'] for result in results if result['status'] == 'created'}
+        record_rollups(rollup_counters, [doc for doc in built if doc['id'] in created])
+        return jsonify({'results': results, 'summary': summary}), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error saving crop health diagnoses in bulk: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# ==================== DISEASE PREVALENCE ROUTES ====================
+
+@routes.route('/disease-prevalence', methods=['GET'])
+@response_cache.cached('prevalence')
+def get_disease_prevalence():
+    """Daily diagnosis counts per location and disease, from precomputed rollups"""
+    try:
+        db = get_database()
+        first, last = parse_range(request.args, max_days=Config.PREVALENCE_MAX_DAYS)
+        limit = int(request.args.get('limit', Config.PREVALENCE_MAX_SERIES))
+        limit = max(1, min(limit, Config.PREVALENCE_MAX_SERIES))
+        
+        result = yield from prevalence(
+            db.disease_rollups, first, last,
+            label=request.args.get('label'),
+            location=request.args.get('location'),
+            limit=limit
+        )
+        
+        return jsonify(result), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error getting disease prevalence: {e}")
+        return jsonify({'error': str(e)}), 500
+
+api = flask_blueprint(routes, 'api', __name__, url_prefix='/api')
+instrument(api)
@@ -0,0 +1,216 @@
+"""
+Async (ASGI) server for the FarmSphere API
+
+Serves the same /api routes as the Flask blueprint, from the same handlers
+in api_routes.py, on Quart with the motor driver. Each MongoDB call is
+awaited instead of holding a thread, so one process can keep thousands of
+slow mobile connections in flight. /predict is not served here; run
+plant_disease_api.py for it and route /api/* to this server.
+
+It also serves GET /api/chats/<chat_id>/stream, the Server-Sent Events
+stream of new chat messages (see chat_events.py).
+
+Requires: pip install quart motor hypercorn
+
+Usage:
+    python asgi_app.py
+    hypercorn asgi_app:app --bind 0.0.0.0:5001
+"""
+import asyncio
+import logging
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from quart import Quart, Blueprint, Response, g, request
+
+from config import Config
+from api_core import RequestData, call_async, set_database_getter, JSON_MIMETYPE
+from api_routes import (
+    routes, response_cache, search_cache, post_cascade, post_counters, rollup_counters, chat_broker
+)
+from chat_events import ChangeStreamRelay
+from database import (
+    connect_to_database, close_connection, check_connection, client_options, database_stats
+)
+from metrics import REGISTRY, HTTP_REQUESTS, HTTP_ERRORS, HTTP_LATENCY
+from pagination import decode_cursor, InvalidCursorError
+
+logging.basicConfig(
+    level=getattr(logging, Config.LOG_LEVEL, logging.INFO),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+app.config.from_object(Config)
+
+# Motor client, created on the serving event loop
+_motor_client = None
+_motor_db = None
+_chat_relay = None
+
+
+def _async_view(handler):
+    async def view(**kwargs):
+        data = RequestData(
+            args=request.args,
+            json=await request.get_json(silent=True) if request.method != 'GET' else None,
+            headers=request.headers,
+            full_path=request.full_path,
+            method=request.method
+        )
+        body, status, headers = await call_async(handler, data, kwargs)
+        return Response(body, status=status, headers=headers, mimetype=JSON_MIMETYPE)
+    view.__name__ = handler.__name__
+    view.__doc__ = handler.__doc__
+    return view
+
+
+api = Blueprint('api', __name__, url_prefix='/api')
+for rule, methods, handler in routes.routes:
+    api.add_url_rule(rule, handler.__name__, _async_view(handler), methods=methods)
+
+
+@api.route('/chats/<chat_id>/stream', methods=['GET'])
+async def chat_stream(chat_id):
+    """Server-Sent Events stream of new messages in a chat"""
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursorError as e:
+            return {'error': str(e)}, 400
+    if chat_broker.at_capacity():
+        return {'error': 'Too many open chat streams, try again later'}, 503
+    
+    response = Response(
+        chat_broker.events(
+            _motor_db, chat_id, cursor,
+            heartbeat=Config.CHAT_STREAM_HEARTBEAT,
+            replay_batch=Config.CHAT_STREAM_REPLAY_BATCH
+        ),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Streams stay open until the client leaves
+    response.timeout = None
+    return response
+
+
+@api.before_request
+async def _start_timer():
+    g._metrics_start = time.perf_counter()
+
+
+@api.after_request
+async def _record(response):
+    """Same request metrics as metrics.instrument() records for Flask"""
+    start = getattr(g, '_metrics_start', None)
+    if start is None:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    HTTP_LATENCY.observe(time.perf_counter() - start, route=route, method=request.method)
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    if response.status_code >= 400:
+        HTTP_ERRORS.inc(route=route, method=request.method)
+    return response
+
+
+app.register_blueprint(api)
+
+
+# Methods flask_cors allows by default, in the order it sends them
+CORS_METHODS = 'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+
+
+@app.after_request
+async def _cors(response):
+    """The headers CORS(app) sends with its defaults on the Flask server
+
+    The request's Origin is echoed back (or * without one), and preflight
+    OPTIONS requests get the allowed methods and every requested header, so
+    browser clients can send JSON POST and DELETE requests to either server.
+    """
+    origin = request.headers.get('Origin')
+    response.headers['Access-Control-Allow-Origin'] = origin or '*'
+    if origin:
+        response.vary.add('Origin')
+    if request.method == 'OPTIONS' and 'Access-Control-Request-Method' in request.headers:
+        response.headers['Access-Control-Allow-Methods'] = CORS_METHODS
+        requested = request.headers.get('Access-Control-Request-Headers')
+        if requested:
+            response.headers['Access-Control-Allow-Headers'] = requested
+    return response
+
+
+@app.before_serving
+async def startup():
+    """Create indexes, run migrations and start the health prober, then open motor"""
+    global _motor_client, _motor_db, _chat_relay
+    try:
+        # Synchronous setup shared with the Flask server, off the event loop
+        await asyncio.to_thread(connect_to_database)
+    except Exception as e:
+        logger.warning(f"MongoDB connection failed: {e}")
+
+    _motor_client = AsyncIOMotorClient(Config.MONGODB_URI, **client_options())
+    _motor_db = _motor_client[Config.DATABASE_NAME]
+    set_database_getter(lambda: _motor_db)
+    post_cascade.start()
+    post_counters.start()
+    rollup_counters.start()
+    if chat_broker.source == 'changestream':
+        _chat_relay = ChangeStreamRelay(chat_broker, _motor_db.chat_messages)
+        _chat_relay.start()
+    logger.info(f"Async API using motor on {Config.DATABASE_NAME}")
+
+
+@app.after_serving
+async def shutdown():
+    if _chat_relay is not None:
+        await _chat_relay.stop()
+    if _motor_client is not None:
+        _motor_client.close()
+    await asyncio.to_thread(post_cascade.stop)
+    await asyncio.to_thread(post_counters.stop)
+    await asyncio.to_thread(rollup_counters.stop)
+    await asyncio.to_thread(close_connection)
+
+
+@app.route('/health', methods=['GET'])
+async def health():
+    """Health check endpoint"""
+    return {
+        'status': 'ok',
+        'mode': 'async',
+        'database_connected': check_connection(),
+        'response_cache': response_cache.stats(),
+        'search_cache': search_cache.stats(),
+        'post_cascade': post_cascade.stats(),
+        'post_counters': post_counters.stats(),
+        'disease_rollups': rollup_counters.stats(),
+        'chat_streams': chat_broker.stats(),
+        'database': database_stats()
+    }
+
+
+@app.route('/api/health', methods=['GET'])
+async def api_health():
+    """API health check endpoint"""
+    return {'status': 'ok', 'database_connected': check_connection()}
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Prometheus text exposition of request and MongoDB metrics"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config as HypercornConfig
+
+    hypercorn_config = HypercornConfig()
+    hypercorn_config.bind = [f"0.0.0.0:{Config.ASGI_PORT}"]
+    logger.info(f"Starting async API server on http://localhost:{Config.ASGI_PORT}")
+    asyncio.run(serve(app, hypercorn_config))
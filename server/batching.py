@@ -0,0 +1,200 @@
+"""
+Dynamic micro-batching scheduler for model inference
+
+Concurrent /predict requests are collected for up to a short time window
+(or until the batch is full) and run through the model in a single forward
+pass. Each caller gets a Future that resolves to its own slice of the output.
+"""
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the scheduler queue is at capacity"""
+    pass
+
+
+class _PendingRequest:
+    """A single submitted input waiting for its batch to run"""
+    __slots__ = ('inputs', 'future', 'enqueued_at')
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchScheduler:
+    """Collects inference requests into batches and fans the results back out"""
+
+    def __init__(self, predict_fn, max_batch_size=16, window_ms=10, queue_depth=256, max_inflight=1):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0, window_ms) / 1000.0
+        self._queue = queue.Queue(maxsize=max(1, int(queue_depth)))
+        self._carry = None
+        self._thread = None
+        self._stop = threading.Event()
+        # With several inference workers, keep that many batches running at once
+        self.max_inflight = max(1, int(max_inflight))
+        self._dispatch = None
+        self._inflight = threading.BoundedSemaphore(self.max_inflight)
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._size_counts = {}
+        self._last_fill = 0.0
+
+    def start(self):
+        """Start the background batching thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        if self.max_inflight > 1:
+            self._dispatch = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix='batch-dispatch')
+        self._thread = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Batch scheduler started (max_batch_size={self.max_batch_size}, "
+            f"window={self.window * 1000:.1f}ms, queue_depth={self._queue.maxsize}, "
+            f"max_inflight={self.max_inflight})"
+        )
+
+    def stop(self, timeout=5.0):
+        """Stop the batching thread, failing any requests still queued"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._dispatch is not None:
+            self._dispatch.shutdown(wait=True)
+            self._dispatch = None
+        pending = [self._carry] if self._carry is not None else []
+        self._carry = None
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in pending:
+            if not item.future.done():
+                item.future.set_exception(RuntimeError('Batch scheduler stopped'))
+
+    def submit(self, inputs):
+        """Queue a batch of inputs (usually shape (1, H, W, C)) and return a Future"""
+        if inputs.shape[0] > self.max_batch_size:
+            raise ValueError(
+                f"Input batch of {inputs.shape[0]} exceeds max batch size {self.max_batch_size}"
+            )
+        item = _PendingRequest(inputs)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            raise QueueFullError('Inference queue is full')
+        return item.future
+
+    def predict(self, inputs, timeout=None):
+        """Submit inputs and block until their predictions are available"""
+        return self.submit(inputs).result(timeout=timeout)
+
+    def stats(self):
+        """Return batch fill statistics"""
+        with self._stats_lock:
+            batches = self._batches
+            items = self._items
+            return {
+                'batches': batches,
+                'items': items,
+                'queue_size': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'window_ms': self.window * 1000,
+                'avg_batch_size': items / batches if batches else 0.0,
+                'avg_fill_ratio': items / (batches * self.max_batch_size) if batches else 0.0,
+                'last_fill_ratio': self._last_fill,
+                'batch_size_counts': dict(sorted(self._size_counts.items())),
+            }
+
+    def _next_item(self, timeout):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        """Block for the first request, then gather more until the window closes"""
+        try:
+            first = self._next_item(timeout=0.1)
+        except queue.Empty:
+            return None
+        batch = [first]
+        size = first.inputs.shape[0]
+        deadline = time.perf_counter() + self.window
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if size + item.inputs.shape[0] > self.max_batch_size:
+                # Doesn't fit; it opens the next batch instead
+                self._carry = item
+                break
+            batch.append(item)
+            size += item.inputs.shape[0]
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._dispatch is None:
+                batch = self._collect()
+                if batch:
+                    self._run_batch(batch)
+                continue
+
+            # Only start collecting once a worker is free, so batches keep
+            # filling while all workers are busy
+            if not self._inflight.acquire(timeout=0.1):
+                continue
+            batch = self._collect()
+            if not batch:
+                self._inflight.release()
+                continue
+            self._dispatch.submit(self._run_batch_and_release, batch)
+
+    def _run_batch_and_release(self, batch):
+        try:
+            self._run_batch(batch)
+        finally:
+            self._inflight.release()
+
+    def _run_batch(self, batch):
+        inputs = [item.inputs for item in batch]
+        size = sum(x.shape[0] for x in inputs)
+        try:
+            stacked = inputs[0] if len(inputs) == 1 else np.concatenate(inputs, axis=0)
+            outputs = self.predict_fn(stacked)
+        except Exception as e:
+            logger.error(f"Batch inference failed for {len(batch)} requests: {e}")
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        offset = 0
+        for item in batch:
+            n = item.inputs.shape[0]
+            item.future.set_result(outputs[offset:offset + n])
+            offset += n
+
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._size_counts[size] = self._size_counts.get(size, 0) + 1
+            self._last_fill = size / self.max_batch_size
+        logger.debug(f"Ran batch of {size}/{self.max_batch_size} ({len(batch)} requests)")
@@ -0,0 +1,116 @@
+"""
+Benchmark the draft-mode decode pipeline against the original preprocessing
+
+Usage:
+    python benchmarks/bench_decode.py [image_dir] [--tolerance 2.0]
+
+Without an image directory, synthetic 12 MP phone-style JPEGs are generated.
+Reports per-image decode latency for both pipelines, concurrent throughput
+through the decode pool, and the pixel difference between the two outputs
+(0-255 scale). Exits non-zero if the mean difference exceeds the tolerance.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from image_decode import decode_image, DecodePool, IMAGE_SIZE
+
+
+def reference_decode(image_bytes):
+    """The original preprocess_image decode: full decode, resize, then RGB"""
+    image = Image.open(io.BytesIO(image_bytes))
+    image = image.resize(IMAGE_SIZE)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return np.array(image).astype(np.float32)
+
+
+def synthetic_images(count, size=(4000, 3000)):
+    """Generate leaf-like JPEGs: smooth gradients with texture and noise"""
+    rng = np.random.default_rng(0)
+    w, h = size
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    images = []
+    for i in range(count):
+        r = 60 + 40 * np.sin(xx / (150 + 30 * i)) + rng.normal(0, 8, (h, w))
+        g = 120 + 60 * np.cos(yy / (200 + 20 * i)) + rng.normal(0, 8, (h, w))
+        b = 40 + 30 * np.sin((xx + yy) / 300) + rng.normal(0, 8, (h, w))
+        arr = np.clip(np.stack([r, g, b], axis=-1), 0, 255).astype(np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(arr).save(buf, format='JPEG', quality=90)
+        images.append(buf.getvalue())
+    return images
+
+
+def load_dir(path):
+    images = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+            with open(os.path.join(path, name), 'rb') as f:
+                images.append(f.read())
+    return images
+
+
+def time_per_image(fn, images, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for data in images:
+            fn(data)
+        best = min(best, time.perf_counter() - start)
+    return best / len(images) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image_dir', nargs='?')
+    parser.add_argument('--count', type=int, default=8, help='synthetic images to generate')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help='max allowed mean absolute pixel difference')
+    args = parser.parse_args()
+
+    images = load_dir(args.image_dir) if args.image_dir else synthetic_images(args.count)
+    if not images:
+        print('No images found')
+        return 1
+    print(f"Images: {len(images)}, avg size {sum(map(len, images)) / len(images) / 1024:.0f} KiB")
+
+    ref_ms = time_per_image(reference_decode, images)
+    new_ms = time_per_image(decode_image, images)
+    print(f"Reference decode: {ref_ms:8.2f} ms/image")
+    print(f"Draft decode:     {new_ms:8.2f} ms/image  ({ref_ms / new_ms:.1f}x)")
+
+    pool = DecodePool(max_workers=args.workers)
+    batch = images * max(1, 32 // len(images))
+    start = time.perf_counter()
+    pool.decode_many(batch)
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    print(f"Pool ({args.workers} workers): {len(batch) / elapsed:8.1f} images/s")
+
+    mean_diffs = []
+    max_diff = 0.0
+    for data in images:
+        diff = np.abs(reference_decode(data) - decode_image(data))
+        mean_diffs.append(float(diff.mean()))
+        max_diff = max(max_diff, float(diff.max()))
+    mean_diff = float(np.mean(mean_diffs))
+    print(f"Pixel difference: mean {mean_diff:.3f}, worst image mean {max(mean_diffs):.3f}, max {max_diff:.0f}")
+
+    if max(mean_diffs) > args.tolerance:
+        print(f"FAIL: mean difference exceeds tolerance {args.tolerance}")
+        return 1
+    print(f"OK: within tolerance {args.tolerance}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
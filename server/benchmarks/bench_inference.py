@@ -0,0 +1,64 @@
+"""
+Microbenchmark: compiled bucketed inference vs model.predict()
+
+Usage:
+    python benchmarks/bench_inference.py [--batch-sizes 1,4,16] [--iterations 50]
+
+Loads the Keras model once and, for each batch size, times the original
+model.predict(..., verbose=0) path against the pre-traced tf.function path
+used by the server. Also checks that both paths produce the same outputs.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from inference_backend import KerasBackend, find_keras_model_path, DEFAULT_BATCH_BUCKETS
+
+
+def latency_ms(fn, batch, iterations):
+    fn(batch)  # exclude one-off setup from the measurement
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(batch)
+        samples.append((time.perf_counter() - start) * 1000)
+    return np.percentile(samples, 50), np.percentile(samples, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', default='1,3,8,16')
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    backend = KerasBackend(find_keras_model_path(), batch_buckets=DEFAULT_BATCH_BUCKETS)
+    print(f"Model load + tracing {len(backend.batch_buckets)} buckets: {time.perf_counter() - start:.1f}s")
+
+    rng = np.random.default_rng(0)
+    shape = tuple(dim or 160 for dim in backend.input_shape[1:3]) + (3,)
+
+    print(f"{'batch':>5}  {'predict() p50':>14}  {'p95':>8}  {'compiled p50':>13}  {'p95':>8}  {'speedup':>7}")
+    for size in [int(s) for s in args.batch_sizes.split(',')]:
+        batch = rng.uniform(0, 255, (size,) + shape).astype(np.float32)
+
+        expected = backend.predict_legacy(batch)
+        actual = backend.predict(batch)
+        if not np.allclose(expected, actual, atol=1e-4):
+            print(f"Batch {size}: outputs differ (max abs diff {np.abs(expected - actual).max():.2e})")
+            return 1
+
+        legacy_p50, legacy_p95 = latency_ms(backend.predict_legacy, batch, args.iterations)
+        compiled_p50, compiled_p95 = latency_ms(backend.predict, batch, args.iterations)
+        print(f"{size:>5}  {legacy_p50:>11.2f} ms  {legacy_p95:>5.2f} ms  "
+              f"{compiled_p50:>10.2f} ms  {compiled_p95:>5.2f} ms  {legacy_p50 / compiled_p50:>6.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
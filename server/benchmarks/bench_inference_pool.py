@@ -0,0 +1,92 @@
+"""
+Benchmark /predict-style throughput across inference worker counts
+
+Usage:
+    python benchmarks/bench_inference_pool.py [--workers 1,2,4] [--batch-size 8] [--seconds 10]
+
+For each worker count, starts an InferencePool, keeps every worker busy with
+batches of random images for a fixed time and reports images/s, scaling
+efficiency relative to one worker, and per-worker resident memory.
+Combine with TF_INTRA_OP_THREADS/TF_INTER_OP_THREADS (e.g. 1 and 1 when
+running one worker per core).
+"""
+import argparse
+import os
+import sys
+import time
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from config import Config
+from inference_pool import InferencePool
+
+
+def run(workers, batch_size, seconds):
+    pool = InferencePool(
+        workers,
+        backend=Config.INFERENCE_BACKEND,
+        quantization=Config.TFLITE_QUANTIZATION,
+        tflite_path=Config.TFLITE_MODEL_PATH or None,
+        batch_buckets=Config.INFERENCE_BATCH_BUCKETS,
+        intra_op_threads=Config.TF_INTRA_OP_THREADS,
+        inter_op_threads=Config.TF_INTER_OP_THREADS
+    )
+    try:
+        pool.wait_ready()
+        rng = np.random.default_rng(0)
+        shape = tuple(dim or 160 for dim in pool.input_shape[1:3]) + (3,)
+        batch = rng.uniform(0, 255, (batch_size,) + shape).astype(np.float32)
+
+        # Warm every worker before measuring
+        for _ in range(workers * 2):
+            pool.predict(batch)
+
+        done = []
+        deadline = time.perf_counter() + seconds
+
+        def client():
+            count = 0
+            while time.perf_counter() < deadline:
+                pool.predict(batch)
+                count += batch_size
+            done.append(count)
+
+        # Two clients per worker so a worker never waits on the dispatcher
+        clients = [threading.Thread(target=client) for _ in range(workers * 2)]
+        start = time.perf_counter()
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+        elapsed = time.perf_counter() - start
+        return sum(done) / elapsed, pool.memory_usage()
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cpus = os.cpu_count() or 1
+    default_workers = ','.join(str(n) for n in sorted({1, 2, max(1, cpus // 2), cpus}))
+    parser.add_argument('--workers', default=default_workers)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"Backend: {Config.INFERENCE_BACKEND}, batch size {args.batch_size}, {cpus} CPUs")
+    print(f"{'workers':>7}  {'images/s':>9}  {'scaling':>7}  {'RSS per worker (MiB)':>22}")
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        throughput, memory = run(workers, args.batch_size, args.seconds)
+        baseline = baseline or throughput / workers
+        rss = [kb / 1024 for kb in memory.values() if kb]
+        rss_text = f"{min(rss):.0f}-{max(rss):.0f}" if rss else 'n/a'
+        print(f"{workers:>7}  {throughput:>9.1f}  {throughput / (baseline * workers):>6.0%}  {rss_text:>22}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Benchmark API response encoding against the original serialize_doc + jsonify
+
+Usage:
+    python benchmarks/bench_json.py [--iterations 2000]
+
+Builds realistic response bodies (a 20-post feed page, a 50-message chat
+page and a 20-entry crop-health page with embedded diagnosis results) and
+times encoding each one to bytes with:
+
+  legacy   serialize_doc() copy, then flask.jsonify
+  json     json_encoder with the standard library
+  orjson   json_encoder with orjson (if installed)
+
+Every encoder's output is checked to decode to the same value as legacy.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bson import ObjectId
+from flask import Flask, jsonify
+
+from json_encoder import ENCODERS
+
+
+def serialize_doc(doc):
+    """The original api_routes helper"""
+    if doc is None:
+        return None
+    if isinstance(doc, dict):
+        result = {}
+        for key, value in doc.items():
+            if isinstance(value, ObjectId):
+                result[key] = str(value)
+            elif isinstance(value, datetime):
+                result[key] = value.isoformat()
+            elif isinstance(value, dict):
+                result[key] = serialize_doc(value)
+            elif isinstance(value, list):
+                result[key] = [serialize_doc(item) for item in value]
+            else:
+                result[key] = value
+        return result
+    return doc
+
+
+def feed_page(n=20):
+    now = datetime(2024, 6, 1, 12, 0, 0, 123000)
+    return {
+        'posts': [{
+            '_id': ObjectId(),
+            'id': f"post-{i}",
+            'authorId': f"user-{i % 7}",
+            'authorName': 'Farmer Name',
+            'content': 'Leaves on the lower branches are turning yellow with brown spots. ' * 4,
+            'image': None,
+            'likes': i * 3,
+            'comments': i,
+            'tags': ['tomato', 'blight', 'help'],
+            'timestamp': now - timedelta(minutes=i),
+            'createdAt': now - timedelta(minutes=i),
+            'updatedAt': now - timedelta(minutes=i),
+        } for i in range(n)],
+        'total': 12345,
+        'page': 1,
+        'limit': n,
+        'next': 'eyJ2IjoiMjAyNC0wNi0wMVQxMTo0MTowMC4xMjMwMDAiLCJkIjp0cnVlfQ',
+    }
+
+
+def chat_page(n=50):
+    now = datetime(2024, 6, 1, 12, 0, 0, 123000)
+    return {
+        'messages': [{
+            '_id': ObjectId(),
+            'id': f"msg-{i}",
+            'chatId': 'chat-1',
+            'userId': f"user-{i % 2}",
+            'userName': 'Farmer Name',
+            'content': 'When should I spray the second round of fungicide?',
+            'timestamp': now + timedelta(seconds=i),
+            'createdAt': now + timedelta(seconds=i),
+        } for i in range(n)],
+        'next': None,
+    }
+
+
+def crop_health_page(n=20):
+    now = datetime(2024, 6, 1, 12, 0, 0, 123000)
+    return {
+        'diagnoses': [{
+            '_id': ObjectId(),
+            'id': f"diag-{i}",
+            'userId': 'user-1',
+            'imageUrl': None,
+            'results': [
+                {'disease': 'Tomato___Late_blight', 'confidence': 0.8731, 'percentage': 87.31},
+                {'disease': 'Tomato___Early_blight', 'confidence': 0.0912, 'percentage': 9.12},
+                {'disease': 'Tomato___healthy', 'confidence': 0.0211, 'percentage': 2.11},
+            ],
+            'location': {'lat': 12.97, 'lng': 77.59},
+            'timestamp': now - timedelta(hours=i),
+            'createdAt': now - timedelta(hours=i),
+        } for i in range(n)],
+        'next': None,
+    }
+
+
+def time_it(fn, body, iterations):
+    fn(body)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(body)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    encoders = {'legacy': lambda body: jsonify(serialize_doc(body)).get_data()}
+    encoders.update(ENCODERS)
+
+    bodies = {'feed (20 posts)': feed_page(), 'chat (50 messages)': chat_page(),
+              'crop health (20)': crop_health_page()}
+
+    failed = False
+    with app.app_context():
+        print(f"{'body':20} " + ' '.join(f"{name:>12}" for name in encoders) + '   (us per response)')
+        for label, body in bodies.items():
+            expected = json.loads(encoders['legacy'](body))
+            timings = []
+            for name, fn in encoders.items():
+                if json.loads(fn(body)) != expected:
+                    print(f"  {name} output differs from legacy for {label}")
+                    failed = True
+                timings.append(time_it(fn, body, args.iterations))
+            legacy = timings[0]
+            print(f"{label:20} " + ' '.join(f"{t:12.1f}" for t in timings)
+                  + '   ' + ' '.join(f"{legacy / t:.1f}x" for t in timings[1:]))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Payload size and latency of full vs. projected list responses
+
+Usage:
+    MONGODB_URI=mongodb://localhost:27017/ DATABASE_NAME=farmsphere_bench \\
+        python benchmarks/bench_projection.py [--kbps 400] [--rtt-ms 300]
+
+Seeds posts with inline images and crop-health diagnoses with full result
+lists into the configured database, then requests the feed and history
+pages with fields=full, fields=summary and a short explicit field list.
+For each it reports the response size, the server time (MongoDB query
+plus encoding, through the Flask test client), and the modelled time on a
+throttled link: server time + one round trip + bytes / bandwidth. The
+defaults approximate a rural 3G connection. Use a throwaway database; the
+seeded documents are deleted afterwards.
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+
+from database import connect_to_database
+from api_routes import api
+from models import Post, CropHealth
+
+
+def seed(db, tag, posts, diagnoses, image_kb):
+    now = datetime.utcnow()
+    image = 'data:image/jpeg;base64,' + base64.b64encode(os.urandom(image_kb * 768)).decode()
+    post_docs = []
+    for i in range(posts):
+        doc = Post.create_post(
+            post_id=f"{tag}-post-{i}", author_id=f"{tag}-user", author_name='Farmer Name',
+            content='Leaves on the lower branches are turning yellow with brown spots. ' * 4,
+            location='Nashik, Maharashtra', tags=['tomato', 'blight'],
+            image=image if i % 2 == 0 else None
+        )
+        doc['timestamp'] = now + timedelta(seconds=i)
+        post_docs.append(doc)
+    db.posts.insert_many(post_docs)
+
+    results = [
+        {'disease': f"Tomato___Class_{k}", 'confidence': 0.9 / (k + 1), 'percentage': 90.0 / (k + 1)}
+        for k in range(3)
+    ]
+    db.crop_health.insert_many([
+        CropHealth.create_diagnosis(
+            diagnosis_id=f"{tag}-diag-{i}", user_id=f"{tag}-user",
+            image_url=image if i % 4 == 0 else None, results=results,
+            location={'lat': 19.99, 'lng': 73.79}
+        )
+        for i in range(diagnoses)
+    ])
+
+
+def measure(client, url, repeats):
+    client.get(url)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        response = client.get(url)
+    server_ms = (time.perf_counter() - start) / repeats * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} returned {response.status_code}: {response.get_data(as_text=True)}")
+    return len(response.get_data()), server_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=40)
+    parser.add_argument('--diagnoses', type=int, default=40)
+    parser.add_argument('--image-kb', type=int, default=48, help='size of each inline image')
+    parser.add_argument('--kbps', type=float, default=400.0, help='link bandwidth in kilobits/s')
+    parser.add_argument('--rtt-ms', type=float, default=300.0, help='link round-trip time')
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    db = connect_to_database()
+    app = Flask(__name__)
+    app.register_blueprint(api)
+    client = app.test_client()
+
+    tag = f"bench-{int(time.time() * 1000)}"
+    seed(db, tag, args.posts, args.diagnoses, args.image_kb)
+
+    routes = {
+        'feed': '/api/posts?limit=20',
+        'crop health': f'/api/users/{tag}-user/crop-health?limit=20',
+    }
+    views = ['full', 'summary', 'id,timestamp']
+
+    try:
+        print(f"link: {args.kbps:.0f} kbps, {args.rtt_ms:.0f} ms RTT\n")
+        print(f"{'route':12} {'fields':14} {'bytes':>9} {'server ms':>10} {'link ms':>9}")
+        for name, url in routes.items():
+            for view in views:
+                size, server_ms = measure(client, f"{url}&fields={view}", args.repeats)
+                link_ms = server_ms + args.rtt_ms + size * 8 / args.kbps
+                print(f"{name:12} {view:14} {size:9d} {server_ms:10.2f} {link_ms:9.0f}")
+    finally:
+        db.posts.delete_many({'authorId': f"{tag}-user"})
+        db.crop_health.delete_many({'userId': f"{tag}-user"})
+
+
+if __name__ == '__main__':
+    main()
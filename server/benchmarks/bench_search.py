@@ -0,0 +1,141 @@
+"""
+Latency of GET /api/posts/search on a large posts collection
+
+Usage:
+    MONGODB_URI=mongodb://localhost:27017/ DATABASE_NAME=farmsphere_bench \\
+        python benchmarks/bench_search.py [--posts 1000000] [--repeats 50] [--cleanup]
+
+Seeds --posts synthetic posts (content drawn from a farming vocabulary with
+a skewed word distribution, tags and locations) into the configured
+database, or reuses them if a previous run left enough behind. Seeding a
+million posts takes a few minutes and about 500 MB. connect_to_database()
+builds the same indexes as the server, including the text and tag indexes.
+
+Each query shape (common and rare terms, text plus location, one and two
+tags, and the second page of a result) is then requested through the Flask
+test client. It is measured once with the search cache disabled (every
+request reaches MongoDB) and once with it enabled (repeat requests for a
+popular query). Reports p50/p95/max latency in ms. Use a throwaway
+database; --cleanup deletes the seeded posts afterwards.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+
+from database import connect_to_database
+from api_routes import api, search_cache
+from models import Post
+
+AUTHOR = 'bench-search'
+
+COMMON = ['leaf', 'leaves', 'yellow', 'spots', 'plant', 'water', 'crop', 'help', 'brown', 'field']
+DISEASE = ['blight', 'rust', 'mildew', 'wilt', 'mosaic', 'rot', 'scab', 'canker', 'curl', 'mold']
+CROPS = ['tomato', 'potato', 'grape', 'apple', 'corn', 'pepper', 'cherry', 'peach', 'soybean', 'strawberry']
+FILLER = ['after', 'rain', 'since', 'week', 'lower', 'branches', 'spreading', 'advice', 'spray', 'soil',
+          'morning', 'humid', 'dry', 'season', 'fertilizer', 'organic', 'neem', 'copper', 'harvest', 'seedlings']
+RARE = [f"variety{i}" for i in range(2000)]
+LOCATIONS = ['Nashik', 'Pune', 'Nagpur', 'Indore', 'Ludhiana', 'Guntur', 'Belgaum', 'Kolar', 'Jalgaon', 'Sangli']
+
+
+def make_content(rng, crop, disease):
+    words = rng.choices(COMMON, k=4) + rng.choices(FILLER, k=8) + [crop, disease]
+    if rng.random() < 0.01:
+        words.append(rng.choice(RARE))
+    rng.shuffle(words)
+    return ' '.join(words)
+
+
+def seed(db, posts, batch):
+    existing = db.posts.count_documents({'authorId': AUTHOR})
+    if existing >= posts:
+        print(f"reusing {existing} seeded posts")
+        return
+    rng = random.Random(existing)
+    start_time = datetime.utcnow() - timedelta(days=730)
+    started = time.perf_counter()
+    for offset in range(existing, posts, batch):
+        docs = []
+        for i in range(offset, min(offset + batch, posts)):
+            crop, disease = rng.choice(CROPS), rng.choice(DISEASE)
+            doc = Post.create_post(
+                post_id=f"{AUTHOR}-{i}", author_id=AUTHOR, author_name='Bench Farmer',
+                content=make_content(rng, crop, disease), location=rng.choice(LOCATIONS),
+                tags=[crop, disease] + (['organic'] if rng.random() < 0.1 else [])
+            )
+            doc['timestamp'] = start_time + timedelta(seconds=i * 63)
+            docs.append(doc)
+        db.posts.insert_many(docs, ordered=False)
+        print(f"\rseeded {offset + len(docs)}/{posts}", end='', flush=True)
+    print(f"\nseeding took {time.perf_counter() - started:.0f}s")
+
+
+def measure(client, url, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}: {response.get_data(as_text=True)}")
+    latencies.sort()
+    return latencies, response.get_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=1_000_000)
+    parser.add_argument('--batch', type=int, default=10_000)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--cleanup', action='store_true', help='delete the seeded posts afterwards')
+    args = parser.parse_args()
+
+    db = connect_to_database()
+    seed(db, args.posts, args.batch)
+
+    app = Flask(__name__)
+    app.register_blueprint(api)
+    client = app.test_client()
+
+    base = '/api/posts/search?limit=20&fields=summary'
+    queries = {
+        'common term': f'{base}&q=blight',
+        'two terms': f'{base}&q=yellow%20mildew',
+        'rare term': f'{base}&q={RARE[7]}',
+        'term+location': f'{base}&q=rust&location=Pune',
+        'one tag': f'{base}&tags=tomato',
+        'two tags': f'{base}&tags=tomato,blight',
+        'tag+location': f'{base}&tags=organic&location=Nashik',
+    }
+
+    try:
+        print(f"\n{'query':16} {'cache':6} {'results':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for name, url in queries.items():
+            _, first = measure(client, url, 1)
+            pages = [(name, url)]
+            if first['next']:
+                pages.append((f"{name} p2", f"{url}&cursor={first['next']}"))
+            for label, page_url in pages:
+                for enabled in (False, True):
+                    search_cache.enabled = enabled
+                    latencies, body = measure(client, page_url, args.repeats)
+                    print(
+                        f"{label:16} {'on' if enabled else 'off':6} {len(body['posts']):8d} "
+                        f"{latencies[len(latencies) // 2]:8.2f} "
+                        f"{latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:8.2f} "
+                        f"{latencies[-1]:8.2f}"
+                    )
+    finally:
+        search_cache.enabled = True
+        if args.cleanup:
+            db.posts.delete_many({'authorId': AUTHOR})
+
+
+if __name__ == '__main__':
+    main()
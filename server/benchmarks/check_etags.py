@@ -0,0 +1,77 @@
+"""
+Conditional GET check for cached routes
+
+Usage:
+    MONGODB_URI=mongodb://localhost:27017/ DATABASE_NAME=farmsphere_stress \\
+        python benchmarks/check_etags.py
+
+Creates a fresh post in the configured database and requests
+GET /api/posts/<id> with the response cache enabled and disabled (as with
+RESPONSE_CACHE_SIZE=0). Either way the response must carry an ETag, a
+request sending it back as If-None-Match must get an empty 304, and after a
+like the old ETag must get a 200 with a new one. Use a throwaway database:
+the test post is deleted afterwards.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+
+from database import connect_to_database
+from api_routes import api, response_cache
+
+
+def check(client, post_id):
+    """Problems found with the current cache setting"""
+    problems = []
+    url = f'/api/posts/{post_id}'
+    first = client.get(url)
+    etag = first.headers.get('ETag')
+    if first.status_code != 200 or not etag:
+        return [f"GET returned {first.status_code} with ETag {etag!r}"]
+
+    revalidated = client.get(url, headers={'If-None-Match': etag})
+    if revalidated.status_code != 304 or revalidated.data:
+        problems.append(f"If-None-Match returned {revalidated.status_code}, expected an empty 304")
+
+    client.post(f'{url}/like', json={'userId': f"etag-user-{time.time_ns()}"})
+    changed = client.get(url, headers={'If-None-Match': etag})
+    if changed.status_code != 200 or changed.headers.get('ETag') == etag:
+        problems.append(f"after a like, the old ETag returned {changed.status_code}, expected 200")
+    return problems
+
+
+def main():
+    db = connect_to_database()
+    app = Flask(__name__)
+    app.register_blueprint(api)
+    client = app.test_client()
+
+    post_id = f"etag-{int(time.time() * 1000)}"
+    client.post('/api/posts', json={'id': post_id, 'content': 'etag check'})
+
+    failures = {}
+    try:
+        for enabled in (True, False):
+            response_cache.enabled = enabled
+            problems = check(client, post_id)
+            print(f"cache {'on' if enabled else 'off'}: {'; '.join(problems) or 'ok'}")
+            if problems:
+                failures[enabled] = problems
+    finally:
+        response_cache.enabled = True
+        db.posts.delete_one({'id': post_id})
+        db.post_likes.delete_many({'postId': post_id})
+
+    if failures:
+        print('FAIL: conditional GETs broken')
+        return 1
+    print('OK: ETags and 304s with and without the cache')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Load test comparing the Flask and ASGI servers on the same /api workload
+
+Usage:
+    # terminal 1: SERVING_MODE=production python plant_disease_api.py   (port 5000)
+    # terminal 2: python asgi_app.py                                      (port 5001)
+    python benchmarks/load_test_api.py --target sync=http://localhost:5000 \\
+        --target async=http://localhost:5001 [--connections 500] [--duration 30]
+
+Seeds a few posts, comments and activities through the first target, then
+for each target opens --connections keep-alive HTTP/1.1 connections and
+issues a mix of feed, post, comments, activities and like requests for
+--duration seconds. --think-ms adds a pause between requests on each
+connection, like a phone that keeps its connection open between screens;
+this is where thread-per-request serving runs out of threads first.
+Reports requests per second, error count and p50/p95/p99 latency per target.
+The client is plain asyncio, so it can hold thousands of connections itself.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+
+class Connection:
+    """Minimal HTTP/1.1 keep-alive client (Content-Length responses only)"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b''
+        head = (
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            + ("Content-Type: application/json\r\n" if body is not None else '')
+            + "\r\n"
+        )
+        self.writer.write(head.encode() + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by server')
+        status = int(status_line.split()[1])
+        length, close = 0, status_line.startswith(b'HTTP/1.0')
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value.strip().lower() == 'close':
+                close = True
+        data = await self.reader.readexactly(length) if length else b''
+        if close:
+            self.close()
+        return status, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def seed(base_url, posts=50):
+    """Create the posts and history the workload reads, through the API"""
+    async def run():
+        url = urlsplit(base_url)
+        conn = Connection(url.hostname, url.port or 80)
+        tag = f"load-{int(time.time())}"
+        for i in range(posts):
+            await conn.request('POST', '/api/posts', {
+                'id': f"{tag}-{i}", 'authorId': f"{tag}-user", 'author': 'Load Test',
+                'content': 'Leaf spots spreading after the rain, any advice? ' * 3,
+                'location': 'Nashik', 'tags': ['tomato', 'blight']
+            })
+            await conn.request('POST', f'/api/posts/{tag}-{i}/comments',
+                               {'userId': f"{tag}-user", 'content': 'Try copper spray'})
+        await conn.request('POST', f'/api/users/{tag}-user/activities/bulk', [
+            {'id': f"{tag}-act-{i}", 'type': 'irrigation', 'crop': 'tomato'} for i in range(100)
+        ])
+        conn.close()
+        return tag, [f"{tag}-{i}" for i in range(posts)]
+    return asyncio.run(run())
+
+
+def workload(rng, tag, post_ids):
+    """One request from the mix: (method, path, body)"""
+    roll = rng.random()
+    post_id = rng.choice(post_ids)
+    if roll < 0.40:
+        return 'GET', '/api/posts?limit=20&fields=summary', None
+    if roll < 0.60:
+        return 'GET', f'/api/posts/{post_id}', None
+    if roll < 0.80:
+        return 'GET', f'/api/posts/{post_id}/comments', None
+    if roll < 0.95:
+        return 'GET', f'/api/users/{tag}-user/activities?limit=20', None
+    return 'POST', f'/api/posts/{post_id}/like', {'userId': f"{tag}-u{rng.randrange(1000)}"}
+
+
+async def run_target(base_url, tag, post_ids, connections, duration, think_ms):
+    url = urlsplit(base_url)
+    deadline = time.perf_counter() + duration
+    latencies = []
+    errors = 0
+
+    async def client(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        conn = Connection(url.hostname, url.port or 80)
+        try:
+            while time.perf_counter() < deadline:
+                method, path, body = workload(rng, tag, post_ids)
+                start = time.perf_counter()
+                try:
+                    status, _ = await conn.request(method, path, body)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    conn.close()
+                    await asyncio.sleep(0.05)
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if status >= 500:
+                    errors += 1
+                if think_ms:
+                    await asyncio.sleep(think_ms / 1000 * rng.uniform(0.5, 1.5))
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(connections)))
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                        help='server to test; repeat for each mode')
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--think-ms', type=float, default=0.0, help='mean pause between requests per connection')
+    parser.add_argument('--posts', type=int, default=50)
+    args = parser.parse_args()
+
+    targets = [t.split('=', 1) for t in args.target]
+    tag, post_ids = seed(targets[0][1], args.posts)
+
+    print(f"{args.connections} connections, {args.duration:.0f}s, think {args.think_ms:.0f}ms\n")
+    print(f"{'target':10} {'requests':>9} {'req/s':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, base_url in targets:
+        latencies, errors, elapsed = asyncio.run(
+            run_target(base_url, tag, post_ids, args.connections, args.duration, args.think_ms)
+        )
+        latencies.sort()
+        print(
+            f"{name:10} {len(latencies):9d} {len(latencies) / elapsed:9.1f} {errors:7d} "
+            f"{percentile(latencies, 0.50) * 1000:8.1f} {percentile(latencies, 0.95) * 1000:8.1f} "
+            f"{percentile(latencies, 0.99) * 1000:8.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
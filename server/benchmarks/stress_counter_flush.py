@@ -0,0 +1,139 @@
+"""
+Concurrency check for counter flushes overlapping reads
+
+Usage:
+    MONGODB_URI=mongodb://localhost:27017/ DATABASE_NAME=farmsphere_stress \\
+        python benchmarks/stress_counter_flush.py [--rounds 20]
+
+Creates a fresh post in the configured database, likes it, and runs the
+coalesced counter flush at the same time as reads of the post, in the two
+orders that used to return wrong counts:
+
+  during flush  GET /api/posts/<id> while the flush's bulk_write has
+                committed but not yet returned (counted twice before)
+  after read    a flush that finishes between a read's find and the
+                counters being added to it (dropped before)
+
+Each round likes the post once more, so every response must show the
+number of post_likes documents, both fresh and from the response cache.
+Use a throwaway database: the test post is deleted afterwards.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+
+from api_core import run_sync, find_one
+from database import connect_to_database
+from api_routes import api, post_counters
+
+
+class PausingCollection:
+    """Collection whose bulk_write commits, then waits for release"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.committed = threading.Event()
+        self.release = threading.Event()
+
+    def bulk_write(self, requests, **kwargs):
+        result = self.collection.bulk_write(requests, **kwargs)
+        self.committed.set()
+        self.release.wait(10)
+        return result
+
+
+def like(client, post_id, user_id):
+    response = client.post(f'/api/posts/{post_id}/like', json={'userId': user_id})
+    return response.json['likes']
+
+
+def during_flush(client, db, post_id):
+    """Likes seen by GET /posts/<id> while a flush has committed but not returned"""
+    paused = PausingCollection(db.posts)
+    get_collection = post_counters.get_collection
+    post_counters.get_collection = lambda: paused
+    flusher = threading.Thread(target=post_counters.flush)
+    flusher.start()
+    try:
+        if not paused.committed.wait(10):
+            raise RuntimeError('flush did not reach bulk_write')
+        seen = {}
+        reader = threading.Thread(target=lambda: seen.update(client.get(f'/api/posts/{post_id}').json))
+        reader.start()
+        # Let the read reach MongoDB before the flush returns
+        time.sleep(0.05)
+    finally:
+        paused.release.set()
+        flusher.join()
+        post_counters.get_collection = get_collection
+    reader.join()
+    return seen.get('likes')
+
+
+def after_read(db, post_id):
+    """Likes returned by a read whose find ran before a flush that finished before the overlay"""
+    flushed = threading.Event()
+    reads = []
+
+    def query():
+        post = yield from find_one(db.posts, {'id': post_id}, {'id': 1, 'likes': 1})
+        if not reads:
+            # First read only: flush between the find and the overlay
+            threading.Thread(target=lambda: (post_counters.flush(), flushed.set())).start()
+            flushed.wait(10)
+        reads.append(post['likes'])
+        return post
+
+    return run_sync(post_counters.read(query))['likes']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    db = connect_to_database()
+    app = Flask(__name__)
+    app.register_blueprint(api)
+    client = app.test_client()
+
+    post_id = f"stress-flush-{int(time.time() * 1000)}"
+    client.post('/api/posts', json={'id': post_id, 'content': 'flush race'})
+
+    failures = []
+    try:
+        for i in range(args.rounds):
+            like(client, post_id, f"user-{i}-a")
+            expected = db.post_likes.count_documents({'postId': post_id})
+            seen = during_flush(client, db, post_id)
+            cached = client.get(f'/api/posts/{post_id}').json['likes']
+            if (seen, cached) != (expected, expected):
+                failures.append(f"round {i} during flush: saw {seen}, cached {cached}, expected {expected}")
+
+            like(client, post_id, f"user-{i}-b")
+            expected = db.post_likes.count_documents({'postId': post_id})
+            seen = after_read(db, post_id)
+            if seen != expected:
+                failures.append(f"round {i} after read: saw {seen}, expected {expected}")
+        stats = post_counters.stats()
+    finally:
+        post_counters.flush()
+        db.posts.delete_one({'id': post_id})
+        db.post_likes.delete_many({'postId': post_id})
+
+    print(f"{args.rounds * 2} overlapping flushes, {stats['rereads']} reads run again")
+    if failures:
+        print('FAIL: ' + '; '.join(failures[:5]))
+        return 1
+    print('OK: reads overlapping flushes show each like once')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
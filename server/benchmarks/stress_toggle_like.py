@@ -0,0 +1,98 @@
+"""
+Concurrency check for like/save toggles
+
+Usage:
+    MONGODB_URI=mongodb://localhost:27017/ DATABASE_NAME=farmsphere_stress \\
+        python benchmarks/stress_toggle_like.py [--users 20] [--taps 50] [--threads 16]
+
+Creates a fresh post in the configured database and hammers
+POST /api/posts/<id>/like and /save from many threads, with every user
+double-tapping concurrently. At the end the post's 'likes' counter must equal
+the number of post_likes documents, and no (postId, userId) pair may appear
+twice. Use a throwaway database: the test post is deleted afterwards.
+"""
+import argparse
+import os
+import sys
+import time
+import random
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+
+from database import connect_to_database
+from api_routes import api, post_counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--taps', type=int, default=50, help='toggles per thread')
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    db = connect_to_database()
+    app = Flask(__name__)
+    app.register_blueprint(api)
+
+    post_id = f"stress-{int(time.time() * 1000)}"
+    app.test_client().post('/api/posts', json={'id': post_id, 'content': 'stress test'})
+
+    errors = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        for _ in range(args.taps):
+            user_id = f"user-{rng.randrange(args.users)}"
+            route = 'like' if rng.random() < 0.8 else 'save'
+            response = client.post(f'/api/posts/{post_id}/{route}', json={'userId': user_id})
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code >= 500:
+                    errors.append(response.json)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    # Write the buffered like counts before comparing
+    post_counters.flush()
+    counter = db.posts.find_one({'id': post_id})['likes']
+    likes = db.post_likes.count_documents({'postId': post_id})
+    duplicates = {
+        name: list(db[name].aggregate([
+            {'$match': {'postId': post_id}},
+            {'$group': {'_id': '$userId', 'n': {'$sum': 1}}},
+            {'$match': {'n': {'$gt': 1}}},
+        ]))
+        for name in ('post_likes', 'saved_posts')
+    }
+
+    total = args.threads * args.taps
+    print(f"{total} toggles in {elapsed:.1f}s ({total / elapsed:.0f}/s), statuses {statuses}")
+    print(f"likes counter {counter}, post_likes documents {likes}")
+
+    # Clean up
+    db.posts.delete_one({'id': post_id})
+    db.post_likes.delete_many({'postId': post_id})
+    db.saved_posts.delete_many({'postId': post_id})
+
+    ok = counter == likes and not any(duplicates.values()) and not errors
+    if not ok:
+        print(f"FAIL: counter drift {counter - likes}, duplicates {duplicates}, errors {errors[:5]}")
+        return 1
+    print('OK: no counter drift, no duplicate pairs')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
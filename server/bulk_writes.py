@@ -0,0 +1,87 @@
+"""
+Idempotent bulk inserts for offline sync
+
+The app queues activities, chat messages and diagnoses while offline and
+replays them when connectivity returns. Every item carries a client-generated
+id, and a unique index on (scope field, id) turns a replayed item into a
+duplicate-key error instead of a second document, so the same batch can be
+uploaded any number of times.
+
+bulk_insert() is a generator that yields its insert_many (see api_core).
+"""
+from datetime import datetime, timezone
+
+from pymongo.errors import BulkWriteError
+
+# MongoDB duplicate key error code
+DUPLICATE_KEY = 11000
+
+
+class InvalidItemError(ValueError):
+    """Raised by a document builder for an item that can't be stored"""
+    pass
+
+
+def parse_client_timestamp(value):
+    """Parse an ISO 8601 timestamp recorded on the device into naive UTC"""
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidItemError(f"Invalid timestamp: {value!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def bulk_insert(collection, items, build_doc):
+    """Validate and insert items with one unordered insert_many
+
+    build_doc(item) returns the document to store or raises InvalidItemError.
+    Returns one status per item, in request order:
+
+      created    inserted now
+      duplicate  already stored by an earlier upload (or earlier in this one)
+      invalid    rejected by validation; nothing written
+      error      the write failed; safe to retry
+    """
+    results = []
+    docs = []
+    positions = []  # docs index -> results index
+    seen = set()
+    for item in items:
+        item_id = item.get('id') if isinstance(item, dict) else None
+        if not isinstance(item_id, str) or not item_id:
+            results.append({'id': item_id, 'status': 'invalid', 'error': 'id is required'})
+            continue
+        if item_id in seen:
+            results.append({'id': item_id, 'status': 'duplicate'})
+            continue
+        try:
+            doc = build_doc(item)
+        except InvalidItemError as e:
+            results.append({'id': item_id, 'status': 'invalid', 'error': str(e)})
+            continue
+        seen.add(item_id)
+        positions.append(len(results))
+        results.append({'id': item_id, 'status': 'created'})
+        docs.append(doc)
+
+    if docs:
+        try:
+            yield collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Unordered: every document not listed in writeErrors was inserted
+            for error in e.details.get('writeErrors', []):
+                result = results[positions[error['index']]]
+                if error.get('code') == DUPLICATE_KEY:
+                    result['status'] = 'duplicate'
+                else:
+                    result['status'] = 'error'
+                    result['error'] = error.get('errmsg', 'write failed')
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return results, summary
@@ -0,0 +1,146 @@
+"""
+In-process caches for FarmSphere backend
+"""
+import hashlib
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a size bound and per-entry TTL"""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entry if full"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove a key if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return hit/miss/eviction counters"""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class PredictionCache:
+    """Content-addressed cache of prediction results keyed by image hash and model version"""
+
+    def __init__(self, maxsize=1024, ttl=3600, shared_collection=None):
+        self.ttl = ttl
+        self._local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._shared = shared_collection
+        self.shared_hits = 0
+        self.shared_errors = 0
+        if self._shared is not None:
+            try:
+                # MongoDB removes shared entries once they are older than the TTL
+                self._shared.create_index('createdAt', expireAfterSeconds=int(ttl))
+            except Exception as e:
+                logger.warning(f"Error creating prediction cache TTL index: {e}")
+
+    @staticmethod
+    def make_key(image_bytes, model_version):
+        """Hash the raw image bytes together with the model version"""
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"{model_version}:{digest}"
+
+    def get(self, key):
+        """Return cached results for key, or None"""
+        results = self._local.get(key)
+        if results is not None or self._shared is None:
+            return results
+        try:
+            doc = self._shared.find_one({'_id': key}, {'results': 1})
+        except Exception as e:
+            self.shared_errors += 1
+            logger.warning(f"Prediction cache lookup failed: {e}")
+            return None
+        if doc is None:
+            return None
+        self.shared_hits += 1
+        self._local.set(key, doc['results'])
+        return doc['results']
+
+    def set(self, key, results):
+        """Store results locally and, if configured, in the shared store"""
+        self._local.set(key, results)
+        if self._shared is None:
+            return
+        try:
+            self._shared.replace_one(
+                {'_id': key},
+                {'_id': key, 'results': results, 'createdAt': datetime.utcnow()},
+                upsert=True
+            )
+        except Exception as e:
+            self.shared_errors += 1
+            logger.warning(f"Prediction cache write failed: {e}")
+
+    def stats(self):
+        """Return cache counters for the health endpoint"""
+        stats = self._local.stats()
+        stats['ttl'] = self.ttl
+        stats['shared'] = self._shared is not None
+        if self._shared is not None:
+            stats['shared_hits'] = self.shared_hits
+            stats['shared_errors'] = self.shared_errors
+        return stats
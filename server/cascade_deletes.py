@@ -0,0 +1,244 @@
+"""
+Background cascade deletion for posts
+
+DELETE /api/posts/<id> only tombstones the post (sets deletedAt), which hides
+it from every read route at once. The post's comments, likes and saves are
+then removed here, off the request path: a worker thread deletes them in
+chunks of _ids selected through the postId indexes, and removes the
+tombstoned post itself last.
+
+Jobs live in memory. A failed job is retried with backoff; a job lost to a
+full queue, exhausted retries or a restart leaves its tombstone behind, and
+the periodic sweep re-queues tombstones older than the grace period. The
+sweep also finds orphans (children whose post no longer exists, e.g. a
+comment inserted while its post was being deleted) and queues their post
+ids, so every delete converges eventually.
+
+The worker uses the synchronous pymongo database under both servers.
+"""
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Collections holding documents that belong to a post, by postId
+CHILD_COLLECTIONS = ('comments', 'post_likes', 'saved_posts')
+
+# Matches posts that have not been deleted
+LIVE = {'deletedAt': None}
+
+# Posts deleted but not yet removed; only these carry deletedAt, so the sparse index serves it
+TOMBSTONED = {'deletedAt': {'$type': 'date'}}
+
+
+class CascadeDeleteQueue:
+    """Worker thread that deletes tombstoned posts and everything that references them"""
+
+    def __init__(self, get_database, chunk_size=500, max_queue=10000, max_retries=5,
+                 sweep_interval=3600, tombstone_grace=300):
+        self.get_database = get_database
+        self.chunk_size = max(1, int(chunk_size))
+        self.max_queue = max(1, int(max_queue))
+        self.max_retries = max_retries
+        self.sweep_interval = sweep_interval
+        self.tombstone_grace = tombstone_grace
+        # (run_at, sequence, post_id, attempt); retries wait in the same heap
+        self._jobs = []
+        self._pending = set()
+        self._sequence = 0
+        self._active = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stop = threading.Event()
+        self._next_sweep = 0.0
+        self.enqueued = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+        self.deleted = {name: 0 for name in CHILD_COLLECTIONS}
+        self.sweeps = 0
+        self.last_sweep = None
+
+    def start(self):
+        """Start the worker; the first sweep runs one interval after start"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        self._thread = threading.Thread(target=self._run, name='cascade-deletes', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, post_id):
+        """Queue the cascade for a tombstoned post; returns False if it was dropped
+
+        Dropped jobs are not lost: the sweep finds the tombstone later.
+        """
+        with self._cond:
+            if post_id in self._pending:
+                return True
+            if len(self._pending) >= self.max_queue:
+                self.dropped += 1
+                logger.warning(f"Cascade queue full, post {post_id} left for the sweep")
+                return False
+            self._push(post_id, 0, time.monotonic())
+            self.enqueued += 1
+            self._cond.notify()
+        return True
+
+    def flush(self, timeout=10.0):
+        """Wait until every queued job has finished (or failed)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=10.0):
+        """Finish queued jobs and stop the worker"""
+        if self._thread is None:
+            return
+        flushed = self.flush(timeout)
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+        if not flushed:
+            logger.warning(f"Cascade deletes stopped with {len(self._pending)} posts pending")
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queued': len(self._pending),
+                'enqueued': self.enqueued,
+                'completed': self.completed,
+                'retried': self.retried,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'deleted': dict(self.deleted),
+                'sweeps': self.sweeps,
+                'last_sweep': self.last_sweep,
+            }
+
+    def _push(self, post_id, attempt, run_at):
+        self._sequence += 1
+        heapq.heappush(self._jobs, (run_at, self._sequence, post_id, attempt))
+        self._pending.add(post_id)
+
+    def _next_job(self):
+        with self._cond:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if self.sweep_interval and now >= self._next_sweep:
+                    return None
+                if self._jobs and self._jobs[0][0] <= now:
+                    _, _, post_id, attempt = heapq.heappop(self._jobs)
+                    self._active += 1
+                    return post_id, attempt
+                wake = self._next_sweep if self.sweep_interval else now + 1.0
+                if self._jobs:
+                    wake = min(wake, self._jobs[0][0])
+                self._cond.wait(max(0.0, wake - now))
+            return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self._next_job()
+            if job is None:
+                if not self._stop.is_set():
+                    self._next_sweep = time.monotonic() + self.sweep_interval
+                    self._sweep_safely()
+                continue
+            post_id, attempt = job
+            try:
+                self.cascade(post_id)
+                with self._cond:
+                    self.completed += 1
+                    self._pending.discard(post_id)
+            except Exception as e:
+                with self._cond:
+                    if attempt < self.max_retries:
+                        self.retried += 1
+                        delay = min(2 ** attempt * 0.5, 30.0)
+                        logger.warning(f"Cascade delete of post {post_id} failed, retrying in {delay}s: {e}")
+                        self._push(post_id, attempt + 1, time.monotonic() + delay)
+                    else:
+                        self.failed += 1
+                        self._pending.discard(post_id)
+                        logger.error(f"Cascade delete of post {post_id} failed, left for the sweep: {e}")
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    self._cond.notify_all()
+
+    def cascade(self, post_id):
+        """Delete a post's comments, likes and saves in chunks, then the tombstone"""
+        db = self.get_database()
+        if db.posts.find_one(dict(LIVE, id=post_id), {'_id': 1}) is not None:
+            logger.warning(f"Post {post_id} is not deleted, skipping cascade")
+            return
+        for name in CHILD_COLLECTIONS:
+            collection = db[name]
+            while True:
+                # One chunk's _ids through the postId-prefixed index, deleted by _id
+                ids = [doc['_id'] for doc in collection.find(
+                    {'postId': post_id}, {'_id': 1}
+                ).limit(self.chunk_size)]
+                if not ids:
+                    break
+                result = collection.delete_many({'_id': {'$in': ids}})
+                with self._cond:
+                    self.deleted[name] += result.deleted_count
+        # Last, so an interrupted cascade keeps its tombstone for the sweep
+        db.posts.delete_one({'id': post_id, 'deletedAt': {'$ne': None}})
+
+    def _sweep_safely(self):
+        try:
+            queued = self.sweep()
+            if queued:
+                logger.info(f"Cascade sweep queued {queued} posts")
+        except PyMongoError as e:
+            logger.warning(f"Cascade sweep failed: {e}")
+        except Exception as e:
+            logger.error(f"Cascade sweep failed: {e}")
+
+    def sweep(self):
+        """Queue stale tombstones and the post ids of orphaned children
+
+        Returns the number of post ids queued.
+        """
+        db = self.get_database()
+        post_ids = set()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.tombstone_grace)
+        for post in db.posts.find({'deletedAt': {'$lt': cutoff}}, {'id': 1}):
+            post_ids.add(post['id'])
+        for name in CHILD_COLLECTIONS:
+            post_ids.update(self.orphaned_post_ids(db[name]))
+        for post_id in post_ids:
+            self.enqueue(post_id)
+        with self._cond:
+            self.sweeps += 1
+            self.last_sweep = datetime.utcnow().isoformat()
+        return len(post_ids)
+
+    @staticmethod
+    def orphaned_post_ids(collection):
+        """postIds referenced in collection that have no post document"""
+        orphans = collection.aggregate([
+            # Sorting on the index prefix lets the group walk distinct keys
+            {'$sort': {'postId': 1}},
+            {'$group': {'_id': '$postId'}},
+            {'$lookup': {'from': 'posts', 'localField': '_id', 'foreignField': 'id', 'as': 'post'}},
+            {'$match': {'post': {'$size': 0}}},
+            {'$project': {'_id': 1}},
+        ], allowDiskUse=True)
+        return [doc['_id'] for doc in orphans]
@@ -0,0 +1,252 @@
+"""
+Server-Sent Events delivery of new chat messages
+
+Clients open GET /api/chats/<chat_id>/stream on the ASGI server and receive
+each new message of the chat as an SSE event instead of polling the
+messages route. Every connection is an asyncio task waiting on a small
+queue, so idle streams cost no thread.
+
+ChatBroker fans messages out to the subscribers of their chat. With the
+'local' source the API routes publish what they insert, which covers every
+write when all /api traffic reaches this process. With 'changestream' a
+ChangeStreamRelay watches chat_messages instead (replica set required), so
+writes made through any instance are delivered.
+
+Each event's id is the pagination cursor of its message (see pagination.py).
+A reconnecting client sends it back as Last-Event-ID, or passes the `resume`
+cursor of its last GET page as ?cursor=, and first receives every message
+stored after it, then live messages.
+"""
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+
+from api_core import run_async
+from json_encoder import dumps
+from metrics import REGISTRY
+from pagination import paginate, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+STREAM_CONNECTIONS = REGISTRY.gauge(
+    'farmsphere_chat_stream_connections', 'Open chat event streams'
+)
+STREAM_EVENTS = REGISTRY.counter(
+    'farmsphere_chat_stream_events_total', 'Chat messages published to streams by source',
+    ['source']
+)
+
+# Cursor before every message, for a chat with no history yet
+CHAT_START = encode_cursor({'timestamp': datetime(1970, 1, 1), '_id': ObjectId('0' * 24)}, 'timestamp')
+
+
+def event_id(doc):
+    """The message's pagination cursor, as it will be read back from MongoDB"""
+    timestamp = doc['timestamp']
+    if isinstance(timestamp, datetime):
+        # Stored datetimes keep milliseconds; a just-inserted document has microseconds
+        timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+    return encode_cursor({'timestamp': timestamp, '_id': doc['_id']}, 'timestamp')
+
+
+def resume_cursor(messages, cursor=None):
+    """Where a stream opened after a page of the messages route should start
+
+    The last message's event id; for an empty page, the cursor the page was
+    read after, or the start of the chat.
+    """
+    if messages:
+        return event_id(messages[-1])
+    return cursor or CHAT_START
+
+
+def format_event(doc):
+    """SSE frame for a chat message"""
+    return f"id: {event_id(doc)}\nevent: message\ndata: ".encode() + dumps(doc) + b"\n\n"
+
+
+class Subscription:
+    """One stream's queue of (message _id, SSE frame); None means it fell behind"""
+
+    def __init__(self, chat_id, loop, maxsize):
+        self.chat_id = chat_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def push(self, item):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Ending the stream is cheaper than buffering for a stalled client;
+            # it reconnects with Last-Event-ID and replays from MongoDB
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class ChatBroker:
+    """In-process fanout of chat messages to the streams of their chat"""
+
+    def __init__(self, source='local', queue_size=100, max_connections=10000):
+        self.source = source
+        self.queue_size = max(1, int(queue_size))
+        self.max_connections = max_connections
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.published = 0
+        self.overflowed = 0
+
+    def at_capacity(self):
+        return self.connections >= self.max_connections
+
+    def subscribe(self, chat_id):
+        """Subscribe the calling event loop to chat_id"""
+        subscription = Subscription(chat_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(chat_id, set()).add(subscription)
+            self.connections += 1
+            STREAM_CONNECTIONS.set(self.connections)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.chat_id)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.chat_id]
+            self.connections -= 1
+            if subscription.overflowed:
+                self.overflowed += 1
+            STREAM_CONNECTIONS.set(self.connections)
+
+    def publish(self, doc):
+        """Called by the API routes after inserting a message (local source only)"""
+        if self.source == 'local':
+            self.fanout(doc, 'local')
+
+    def fanout(self, doc, source):
+        """Deliver a stored message (with _id and timestamp) to its chat's streams"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(doc.get('chatId'), ()))
+            self.published += 1
+        STREAM_EVENTS.inc(source=source)
+        if not subscribers:
+            return
+        # Encoded once however many clients watch the chat
+        item = (doc['_id'], format_event(doc))
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for subscription in subscribers:
+            if subscription.loop is running:
+                subscription.push(item)
+            else:
+                subscription.loop.call_soon_threadsafe(subscription.push, item)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'source': self.source,
+                'connections': self.connections,
+                'chats': len(self._subscribers),
+                'published': self.published,
+                'overflowed': self.overflowed,
+            }
+
+    async def events(self, db, chat_id, cursor=None, heartbeat=15.0, replay_batch=200):
+        """SSE frames for one stream: messages after cursor, then live ones
+
+        db is the motor database; the generator unsubscribes when the client
+        disconnects and the server cancels it.
+        """
+        # Subscribe before replaying so nothing inserted meanwhile is missed
+        subscription = self.subscribe(chat_id)
+        try:
+            yield b"retry: 3000\n\n"
+            replayed = set()
+            while cursor:
+                docs, cursor = await run_async(paginate(
+                    db.chat_messages, {'chatId': chat_id}, 'timestamp', 1, replay_batch, cursor=cursor
+                ))
+                for doc in docs:
+                    replayed.add(doc['_id'])
+                    yield format_event(doc)
+            # Only messages queued during the replay can repeat one of it
+            overlap = subscription.queue.qsize()
+            if not overlap:
+                replayed.clear()
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing idle streams
+                    yield b": keepalive\n\n"
+                    continue
+                if item is None:
+                    return
+                message_id, frame = item
+                if overlap:
+                    overlap -= 1
+                    duplicate = message_id in replayed
+                    if not overlap:
+                        replayed.clear()
+                    if duplicate:
+                        continue
+                yield frame
+        finally:
+            self.unsubscribe(subscription)
+
+
+class ChangeStreamRelay:
+    """Feeds a broker from a MongoDB change stream on chat_messages (motor)"""
+
+    def __init__(self, broker, collection):
+        self.broker = broker
+        self.collection = collection
+        self._task = None
+
+    def start(self):
+        """Start relaying on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        resume_token = None
+        delay = 1.0
+        while True:
+            try:
+                async with self.collection.watch(
+                    [{'$match': {'operationType': 'insert'}}], resume_after=resume_token
+                ) as stream:
+                    logger.info("Relaying chat messages from the change stream")
+                    delay = 1.0
+                    async for change in stream:
+                        resume_token = change['_id']
+                        self.broker.fanout(change['fullDocument'], 'changestream')
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Chat change stream failed, reconnecting in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
@@ -13,11 +13,134 @@ class Config:
     # MongoDB Configuration
     MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
     DATABASE_NAME = os.getenv('DATABASE_NAME', 'farmsphere')
+    # Connection pool; sized for HTTP_THREADS plus background writers
+    MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', '100'))
+    MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', '0'))
+    # Idle connections are closed after this long; 0 keeps them open
+    MONGODB_MAX_IDLE_TIME_MS = int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', '300000'))
+    # How long a request waits for a free connection before failing; 0 waits forever
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', '5000'))
+    # Write concern 'w' (e.g. 1 or majority); empty uses the server default
+    MONGODB_WRITE_CONCERN = os.getenv('MONGODB_WRITE_CONCERN', '')
+    MONGODB_WRITE_TIMEOUT_MS = int(os.getenv('MONGODB_WRITE_TIMEOUT_MS', '0'))
+    # Seconds between background pings whose result /health reports
+    DB_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_HEALTH_CHECK_INTERVAL', '5'))
     
     # Flask Configuration
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
     DEBUG = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
     
+    # Serving Configuration
+    # 'production' disables the debug reloader and runs inference in worker processes
+    SERVING_MODE = os.getenv('SERVING_MODE', 'development').lower()
+    HTTP_THREADS = int(os.getenv('HTTP_THREADS', '16'))
+    # Port of the async /api server (asgi_app.py)
+    ASGI_PORT = int(os.getenv('ASGI_PORT', '5001'))
+    # Inference worker processes; 0 means one per CPU in production, in-process otherwise
+    INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '0'))
+    # TensorFlow thread pools per worker; 0 lets TensorFlow decide
+    TF_INTRA_OP_THREADS = int(os.getenv('TF_INTRA_OP_THREADS', '0'))
+    TF_INTER_OP_THREADS = int(os.getenv('TF_INTER_OP_THREADS', '0'))
+    
+    # API Pagination Configuration
+    MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '100'))
+    # Seconds between refreshes of the estimated posts total
+    POSTS_COUNT_TTL = int(os.getenv('POSTS_COUNT_TTL', '60'))
+    # JSON encoder for /api responses: auto (orjson if installed), orjson or json
+    JSON_ENCODER = os.getenv('JSON_ENCODER', 'auto').lower()
+    # Largest array accepted by the offline-sync bulk upload routes
+    BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '500'))
+    
+    # API Response Cache Configuration
+    # Cached feed, post and comment responses; 0 disables the cache
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '1024'))
+    # Upper bound on staleness when another instance changed the data
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '30'))
+    
+    # Post Counter Configuration
+    # Seconds between coalesced writes of like/comment counters
+    COUNTER_FLUSH_INTERVAL = float(os.getenv('COUNTER_FLUSH_INTERVAL', '1.0'))
+    # Flush early once this many posts have unwritten changes
+    COUNTER_FLUSH_MAX_PENDING = int(os.getenv('COUNTER_FLUSH_MAX_PENDING', '1000'))
+    
+    # Disease Prevalence Configuration
+    # Seconds between batched writes of new diagnoses into disease_rollups
+    ROLLUP_FLUSH_INTERVAL = float(os.getenv('ROLLUP_FLUSH_INTERVAL', '5.0'))
+    PREVALENCE_MAX_DAYS = int(os.getenv('PREVALENCE_MAX_DAYS', '366'))
+    # Most (location, disease) series per response
+    PREVALENCE_MAX_SERIES = int(os.getenv('PREVALENCE_MAX_SERIES', '500'))
+    
+    # Post Search Configuration
+    # Cached search responses; 0 disables the cache
+    SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '256'))
+    SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '60'))
+    
+    # Chat Streaming Configuration
+    # local: publish this process's inserts; changestream: watch MongoDB (replica set)
+    CHAT_STREAM_SOURCE = os.getenv('CHAT_STREAM_SOURCE', 'local').lower()
+    CHAT_STREAM_MAX_CONNECTIONS = int(os.getenv('CHAT_STREAM_MAX_CONNECTIONS', '10000'))
+    # Messages buffered per stream before a slow client is disconnected
+    CHAT_STREAM_QUEUE_SIZE = int(os.getenv('CHAT_STREAM_QUEUE_SIZE', '100'))
+    # Seconds between keepalive comments on idle streams
+    CHAT_STREAM_HEARTBEAT = float(os.getenv('CHAT_STREAM_HEARTBEAT', '15'))
+    # Messages per query when replaying after Last-Event-ID
+    CHAT_STREAM_REPLAY_BATCH = int(os.getenv('CHAT_STREAM_REPLAY_BATCH', '200'))
+    
+    # Post Deletion Configuration
+    # Documents removed per delete_many while cascading a deleted post
+    CASCADE_CHUNK_SIZE = int(os.getenv('CASCADE_CHUNK_SIZE', '500'))
+    CASCADE_QUEUE_SIZE = int(os.getenv('CASCADE_QUEUE_SIZE', '10000'))
+    CASCADE_MAX_RETRIES = int(os.getenv('CASCADE_MAX_RETRIES', '5'))
+    # Seconds between sweeps for unfinished deletes and orphans; 0 disables
+    CASCADE_SWEEP_INTERVAL = int(os.getenv('CASCADE_SWEEP_INTERVAL', '3600'))
+    # Tombstones younger than this are assumed to still be cascading
+    CASCADE_TOMBSTONE_GRACE = int(os.getenv('CASCADE_TOMBSTONE_GRACE', '300'))
+    
+    # Logging Configuration
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    # Fraction of predictions whose top-5 classes are logged at DEBUG level
+    PREDICTION_LOG_SAMPLE_RATE = float(os.getenv('PREDICTION_LOG_SAMPLE_RATE', '0.01'))
+    
+    # Inference Backend Configuration
+    # 'keras' loads the full model; 'tflite' loads a quantized conversion
+    INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras').lower()
+    TFLITE_QUANTIZATION = os.getenv('TFLITE_QUANTIZATION', 'float16').lower()
+    TFLITE_MODEL_PATH = os.getenv('TFLITE_MODEL_PATH', '')
+    TFLITE_NUM_THREADS = int(os.getenv('TFLITE_NUM_THREADS', '0'))
+    # Keras batches are padded up to one of these sizes, each traced once at load
+    INFERENCE_BATCH_BUCKETS = sorted({
+        int(size) for size in os.getenv('INFERENCE_BATCH_BUCKETS', '1,2,4,8,16,32').split(',') if size.strip()
+    })
+    
+    # Inference Batching Configuration
+    BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', '10'))
+    BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '16'))
+    BATCH_QUEUE_DEPTH = int(os.getenv('BATCH_QUEUE_DEPTH', '256'))
+    # Batch sizes traced with dummy inputs before the model reports ready
+    WARMUP_BATCH_SIZES = sorted({
+        int(size) for size in os.getenv('WARMUP_BATCH_SIZES', f'1,{BATCH_MAX_SIZE}').split(',') if size.strip()
+    })
+    PREDICT_BATCH_MAX_IMAGES = int(os.getenv('PREDICT_BATCH_MAX_IMAGES', '64'))
+    DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', '4'))
+    DECODE_QUEUE_DEPTH = int(os.getenv('DECODE_QUEUE_DEPTH', '64'))
+    MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+    MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', str(50 * 1000 * 1000)))
+    
+    # Prediction History Write-Behind Configuration
+    HISTORY_WRITE_BATCH_SIZE = int(os.getenv('HISTORY_WRITE_BATCH_SIZE', '100'))
+    HISTORY_WRITE_INTERVAL = float(os.getenv('HISTORY_WRITE_INTERVAL', '1.0'))
+    HISTORY_WRITE_QUEUE_SIZE = int(os.getenv('HISTORY_WRITE_QUEUE_SIZE', '10000'))
+    # Seconds /predict waits for queue space before skipping the history write
+    HISTORY_WRITE_PUT_TIMEOUT = float(os.getenv('HISTORY_WRITE_PUT_TIMEOUT', '0.05'))
+    
+    # Prediction Cache Configuration
+    MODEL_VERSION = os.getenv('MODEL_VERSION', '')
+    PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '1024'))
+    PREDICTION_CACHE_TTL = int(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+    PREDICTION_CACHE_SHARED = os.getenv('PREDICTION_CACHE_SHARED', 'False').lower() == 'true'
+    
     @staticmethod
     def init_app(app):
         """Initialize app with configuration"""
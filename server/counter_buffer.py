@@ -0,0 +1,260 @@
+"""
+Write-coalescing buffer for post counters
+
+Likes and comments on a popular post used to $inc the same posts document
+once per request, so every tap contended for one document. Routes now add
+their delta here instead. A background thread sums the deltas per post and
+writes them every flush interval as one unordered bulk_write of $inc
+updates, so a burst of thousands of likes costs one update per post.
+
+Until a delta is written, read() adds it to counters read from MongoDB, so
+responses on this instance (including the user's own like or comment) show
+the new count at once. Other instances see it after the next flush. Failed
+writes are put back and retried on the next flush. stop() flushes whatever
+is left.
+
+A flush that overlaps a read leaves it unknown whether MongoDB already
+returned that flush's deltas: adding them again would count them twice, and
+a flush finishing after the read would drop them. Every flush bumps a
+sequence number when it starts and when it finishes. read() waits out a
+running flush, then re-runs its query if the sequence moved while it ran.
+
+Keys are one field's value (a post id), or a tuple of values for a compound
+key_field such as the (location, day, label) of disease rollups. With
+upsert=True, documents that don't exist yet are created by the flush.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+COUNTER_INCREMENTS = REGISTRY.counter(
+    'farmsphere_counter_increments_total', 'Counter changes buffered by buffer and field',
+    ['buffer', 'field']
+)
+COUNTER_FLUSHES = REGISTRY.counter(
+    'farmsphere_counter_flushes_total', 'Counter buffer flushes by buffer and result', ['buffer', 'result']
+)
+COUNTER_FLUSHED_UPDATES = REGISTRY.counter(
+    'farmsphere_counter_flushed_updates_total', 'Documents updated by counter buffer flushes', ['buffer']
+)
+COUNTER_FLUSH_SECONDS = REGISTRY.histogram(
+    'farmsphere_counter_flush_seconds', 'Duration of counter buffer bulk writes', ['buffer']
+)
+COUNTER_PENDING = REGISTRY.gauge(
+    'farmsphere_counter_pending_documents', 'Documents with counter changes not yet written', ['buffer']
+)
+COUNTER_REREADS = REGISTRY.counter(
+    'farmsphere_counter_rereads_total', 'Reads run again because a flush overlapped them', ['buffer']
+)
+
+# Queries read() runs before giving up on a read no flush overlaps
+READ_ATTEMPTS = 5
+
+
+class CounterBuffer:
+    """Per-document $inc deltas, summed in memory and flushed with bulk_write"""
+
+    def __init__(self, get_collection, key_field='id', flush_interval=1.0, max_pending=1000,
+                 upsert=False, name='post_counters'):
+        self.get_collection = get_collection
+        self.key_field = key_field
+        self.upsert = upsert
+        self.name = name
+        self.flush_interval = flush_interval
+        self.max_pending = max(1, int(max_pending))
+        self._pending = {}
+        # Deltas taken by a flush that is still writing
+        self._flushing = {}
+        # Bumped when a flush takes its batch and when it finishes; odd while writing
+        self._sequence = 0
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.increments = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.updates = 0
+        self.rereads = 0
+
+    def start(self):
+        """Start the background flusher"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop the flusher and write the remaining deltas"""
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def add(self, key, field, delta):
+        """Buffer a change of delta to field on the document with key"""
+        with self._lock:
+            deltas = self._pending.setdefault(key, {})
+            deltas[field] = deltas.get(field, 0) + delta
+            self.increments += 1
+            pending = len(self._pending)
+        COUNTER_INCREMENTS.inc(buffer=self.name, field=field)
+        COUNTER_PENDING.set(pending, buffer=self.name)
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def sequence(self):
+        """Flush sequence number; take it before reading documents to overlay()"""
+        with self._lock:
+            return self._sequence
+
+    def overlay(self, docs, since):
+        """Add unwritten changes to the counters of docs, read from MongoDB after sequence() returned since
+
+        Returns False, leaving docs untouched, if a flush was running or ran
+        meanwhile; the documents must then be read again.
+        """
+        with self._lock:
+            if since % 2 or since != self._sequence:
+                return False
+            self._apply(docs, self._pending)
+            return True
+
+    def read(self, query, docs=lambda result: [result]):
+        """Run query and add unwritten changes to the documents it read
+
+        query is a function returning an api_core generator (such as a
+        paginate() call) and docs picks the documents out of its result.
+        A generator itself; call it with `yield from`.
+        """
+        for _ in range(READ_ATTEMPTS):
+            since = self.sequence()
+            if since % 2:
+                yield self._wait_for_flush()
+                continue
+            result = yield from query()
+            if self.overlay(docs(result), since):
+                return result
+            with self._lock:
+                self.rereads += 1
+            COUNTER_REREADS.inc(buffer=self.name)
+        # Flushes kept overlapping: add only the changes no flush has taken,
+        # which can undercount but never counts a change twice
+        logger.warning(f"{self.name}: reads kept overlapping flushes; counters may lag")
+        result = yield from query()
+        with self._lock:
+            self._apply(docs(result), self._pending)
+        return result
+
+    def _apply(self, docs, deltas):
+        for doc in docs:
+            if not doc:
+                continue
+            for field, delta in deltas.get(self._key_of(doc), {}).items():
+                if field in doc:
+                    doc[field] += delta
+
+    def _wait_for_flush(self, timeout=1.0):
+        """Block until the running flush finishes, or an awaitable doing so under an event loop"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._idle.wait(timeout)
+            return None
+        return asyncio.to_thread(self._idle.wait, timeout)
+
+    def flush(self):
+        """Write every buffered delta now; returns the number of documents updated"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, {}
+                batch = self._flushing
+                self._sequence += 1
+                self._idle.clear()
+            COUNTER_PENDING.set(0, buffer=self.name)
+
+            keys = list(batch)
+            now = datetime.utcnow()
+            requests = [
+                UpdateOne(self._filter(key), {'$inc': batch[key], '$set': {'updatedAt': now}},
+                          upsert=self.upsert)
+                for key in keys
+            ]
+            failed = []
+            start = time.perf_counter()
+            try:
+                self.get_collection().bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                failed = [keys[error['index']] for error in e.details.get('writeErrors', [])]
+                logger.warning(f"Counter flush failed for {len(failed)} of {len(keys)} documents")
+            except Exception as e:
+                failed = keys
+                logger.warning(f"Counter flush of {len(keys)} documents failed, retrying next flush: {e}")
+            COUNTER_FLUSH_SECONDS.observe(time.perf_counter() - start, buffer=self.name)
+
+            with self._lock:
+                # Put failed deltas back so the next flush retries them
+                for key in failed:
+                    deltas = self._pending.setdefault(key, {})
+                    for field, delta in batch[key].items():
+                        deltas[field] = deltas.get(field, 0) + delta
+                self._flushing = {}
+                self._sequence += 1
+                self._idle.set()
+                written = len(keys) - len(failed)
+                self.flushes += 1
+                self.updates += written
+                if failed:
+                    self.failed_flushes += 1
+                COUNTER_PENDING.set(len(self._pending), buffer=self.name)
+            COUNTER_FLUSHES.inc(buffer=self.name, result='error' if failed else 'ok')
+            COUNTER_FLUSHED_UPDATES.inc(written, buffer=self.name)
+            return written
+
+    def _filter(self, key):
+        if isinstance(self.key_field, tuple):
+            return dict(zip(self.key_field, key))
+        return {self.key_field: key}
+
+    def _key_of(self, doc):
+        if isinstance(self.key_field, tuple):
+            return tuple(doc.get(field) for field in self.key_field)
+        return doc.get(self.key_field)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'increments': self.increments,
+                'flushes': self.flushes,
+                'failed_flushes': self.failed_flushes,
+                'updates': self.updates,
+                'rereads': self.rereads,
+                'flush_interval': self.flush_interval,
+            }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Counter flush failed: {e}")
@@ -2,8 +2,10 @@
 MongoDB database connection and initialization
 """
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, DuplicateKeyError, OperationFailure
 from config import Config
+from migrations import run_migrations, MigrationError
+from db_monitoring import PoolMonitor, CommandMonitor, HealthProber
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,6 +13,8 @@ logger = logging.getLogger(__name__)
 # Global database connection
 _client = None
 _db = None
+_pool_monitor = PoolMonitor()
+_prober = None
 
 def get_database():
     """Get MongoDB database instance"""
@@ -19,17 +23,33 @@ def get_database():
         connect_to_database()
     return _db
 
+def client_options():
+    """MongoClient keyword arguments from Config"""
+    options = {
+        'maxPoolSize': Config.MONGODB_MAX_POOL_SIZE,
+        'minPoolSize': Config.MONGODB_MIN_POOL_SIZE,
+        'serverSelectionTimeoutMS': Config.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        'connectTimeoutMS': Config.MONGODB_CONNECT_TIMEOUT_MS,
+        'event_listeners': [_pool_monitor, CommandMonitor()],
+    }
+    if Config.MONGODB_MAX_IDLE_TIME_MS:
+        options['maxIdleTimeMS'] = Config.MONGODB_MAX_IDLE_TIME_MS
+    if Config.MONGODB_WAIT_QUEUE_TIMEOUT_MS:
+        options['waitQueueTimeoutMS'] = Config.MONGODB_WAIT_QUEUE_TIMEOUT_MS
+    if Config.MONGODB_WRITE_CONCERN:
+        w = Config.MONGODB_WRITE_CONCERN
+        options['w'] = int(w) if w.isdigit() else w
+    if Config.MONGODB_WRITE_TIMEOUT_MS:
+        options['wTimeoutMS'] = Config.MONGODB_WRITE_TIMEOUT_MS
+    return options
+
 def connect_to_database():
     """Connect to MongoDB database"""
-    global _client, _db
+    global _client, _db, _prober
     
     try:
         # Create MongoDB client
-        _client = MongoClient(
-            Config.MONGODB_URI,
-            serverSelectionTimeoutMS=5000,  # 5 second timeout
-            connectTimeoutMS=5000
-        )
+        _client = MongoClient(Config.MONGODB_URI, **client_options())
         
         # Test connection
         _client.admin.command('ping')
@@ -39,8 +59,15 @@ def connect_to_database():
         
         logger.info(f"Successfully connected to MongoDB: {Config.DATABASE_NAME}")
         
+        # Health endpoints report the prober's latest result instead of pinging
+        if _prober is not None:
+            _prober.stop()
+        _prober = HealthProber(_client, interval=Config.DB_HEALTH_CHECK_INTERVAL)
+        _prober.start()
+        
         # Create indexes for better query performance
         create_indexes()
+        apply_migrations()
         
         return _db
         
@@ -66,46 +93,114 @@ def create_indexes():
         # Posts collection indexes
         _db.posts.create_index("id", unique=True)
         _db.posts.create_index("authorId")
-        _db.posts.create_index("timestamp")
-        _db.posts.create_index([("timestamp", -1)])  # Descending for recent posts
+        _db.posts.create_index([("timestamp", -1), ("_id", -1)])  # Feed, newest first
+        _db.posts.create_index("deletedAt", sparse=True)  # Tombstones awaiting cascade
+        _db.posts.create_index([("content", "text")])  # Search by text
+        _db.posts.create_index([("tags", 1), ("timestamp", -1), ("_id", -1)])  # Search by tag
         
         # Comments collection indexes
-        _db.comments.create_index("postId")
-        _db.comments.create_index("timestamp")
+        _db.comments.create_index([("postId", 1), ("timestamp", 1)])
         
         # Activities collection indexes
-        _db.activities.create_index("userId")
-        _db.activities.create_index("date")
-        _db.activities.create_index([("date", -1)])
+        _db.activities.create_index([("userId", 1), ("timestamp", -1), ("_id", -1)])
         
         # Chat messages collection indexes
-        _db.chat_messages.create_index("chatId")
-        _db.chat_messages.create_index("timestamp")
+        _db.chat_messages.create_index([("chatId", 1), ("timestamp", 1), ("_id", 1)])
         
         # Crop health history indexes
-        _db.crop_health.create_index("userId")
-        _db.crop_health.create_index("timestamp")
+        _db.crop_health.create_index([("userId", 1), ("timestamp", -1), ("_id", -1)])
+        
+        # Like/save toggles rely on one document per (postId, userId)
+        create_unique_pair_index(_db.post_likes, counter_field='likes')
+        create_unique_pair_index(_db.saved_posts)
+        _db.saved_posts.create_index([("userId", 1), ("createdAt", -1), ("_id", -1)])
+        
+        # Disease prevalence rollups: one document per (location, day, label)
+        _db.disease_rollups.create_index([("location", 1), ("day", 1), ("label", 1)], unique=True)
+        _db.disease_rollups.create_index([("label", 1), ("day", 1)])
+        _db.disease_rollups.create_index("day")
+        
+        # Unique client-id indexes for offline sync are built by migration 3,
+        # which refuses to run over existing duplicates
         
         logger.info("Database indexes created successfully")
         
     except Exception as e:
         logger.warning(f"Error creating indexes: {e}")
 
+def apply_migrations():
+    """Run pending versioned migrations (see migrations.py)"""
+    try:
+        applied = run_migrations(_db)
+        if applied:
+            logger.info(f"Applied database migrations: {applied}")
+    except MigrationError as e:
+        logger.error(f"Migration blocked, will retry at next start: {e}")
+    except Exception as e:
+        logger.warning(f"Error applying migrations: {e}")
+
+def create_unique_index(collection, fields):
+    """Create a unique index on fields, keeping the first of any duplicate documents
+
+    Returns the key values of the duplicate groups that were removed.
+    """
+    keys = [(field, 1) for field in fields]
+    try:
+        collection.create_index(keys, unique=True)
+        return []
+    except DuplicateKeyError:
+        pass
+    except OperationFailure as e:
+        if e.code != 11000:
+            raise
+    
+    duplicates = collection.aggregate([
+        {'$group': {'_id': {field: f'${field}' for field in fields},
+                    'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}
+    ], allowDiskUse=True)
+    removed = []
+    for group in duplicates:
+        collection.delete_many({'_id': {'$in': group['ids'][1:]}})
+        removed.append(group['_id'])
+    logger.warning(f"Removed duplicate {collection.name} entries for {len(removed)} keys")
+    
+    collection.create_index(keys, unique=True)
+    return removed
+
+def create_unique_pair_index(collection, counter_field=None):
+    """Create the unique (postId, userId) index, removing duplicates left by older toggles
+
+    If counter_field is given, the matching counter on each affected post is
+    recomputed from the remaining documents.
+    """
+    removed = create_unique_index(collection, ["postId", "userId"])
+    
+    if counter_field:
+        for post_id in {key['postId'] for key in removed}:
+            count = collection.count_documents({'postId': post_id})
+            _db.posts.update_one({'id': post_id}, {'$set': {counter_field: count}})
+
 def close_connection():
     """Close MongoDB connection"""
-    global _client
+    global _client, _prober
+    if _prober:
+        _prober.stop()
+        _prober = None
     if _client:
         _client.close()
         logger.info("MongoDB connection closed")
 
 def check_connection():
-    """Check if database connection is alive"""
-    global _client, _db
-    try:
-        if _client is None or _db is None:
-            return False
-        _client.admin.command('ping')
-        return True
-    except:
+    """Whether the last background ping succeeded (no round trip to MongoDB)"""
+    if _prober is None or _db is None:
         return False
+    return _prober.healthy
+
+def database_stats():
+    """Latest health probe and connection pool statistics"""
+    return {
+        'health': _prober.status() if _prober is not None else None,
+        'pool': _pool_monitor.stats(),
+    }
 
@@ -0,0 +1,192 @@
+"""
+MongoDB connection pool monitoring and background health probing
+
+PoolMonitor and CommandMonitor are pymongo event listeners registered on
+the MongoClient. They track checked-out connections, time spent waiting
+for a connection, and per-command latency, and export them to /metrics.
+HealthProber pings the server from a background thread so health endpoints
+return the latest result instead of sending a ping per request.
+"""
+import threading
+import time
+import logging
+from datetime import datetime
+
+from pymongo import monitoring
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+POOL_CHECKED_OUT = REGISTRY.gauge(
+    'farmsphere_mongodb_pool_checked_out', 'MongoDB connections currently checked out'
+)
+POOL_CONNECTIONS = REGISTRY.gauge(
+    'farmsphere_mongodb_pool_connections', 'Open MongoDB connections'
+)
+POOL_WAIT_SECONDS = REGISTRY.histogram(
+    'farmsphere_mongodb_pool_wait_seconds', 'Time spent waiting to check out a MongoDB connection',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+POOL_CHECKOUT_FAILURES = REGISTRY.counter(
+    'farmsphere_mongodb_pool_checkout_failures_total', 'Failed MongoDB connection checkouts by reason',
+    ['reason']
+)
+COMMAND_SECONDS = REGISTRY.histogram(
+    'farmsphere_mongodb_command_duration_seconds', 'MongoDB command latency by command',
+    ['command']
+)
+COMMAND_FAILURES = REGISTRY.counter(
+    'farmsphere_mongodb_command_failures_total', 'Failed MongoDB commands by command',
+    ['command']
+)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connections and measures checkout wait time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Checkout events fire on the thread requesting the connection
+        self._local = threading.local()
+        self.checked_out = 0
+        self.connections = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'checked_out': self.checked_out,
+                'connections': self.connections,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'avg_wait_ms': self.wait_seconds_total / self.checkouts * 1000 if self.checkouts else 0.0,
+                'max_wait_ms': self.wait_seconds_max * 1000,
+            }
+
+    def _waited(self):
+        start = getattr(self._local, 'start', None)
+        self._local.start = None
+        return time.perf_counter() - start if start is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.start = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = self._waited()
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            POOL_CHECKED_OUT.set(self.checked_out)
+        POOL_WAIT_SECONDS.observe(waited)
+
+    def connection_check_out_failed(self, event):
+        self._waited()
+        with self._lock:
+            self.checkout_failures += 1
+        POOL_CHECKOUT_FAILURES.inc(reason=str(event.reason))
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+            POOL_CHECKED_OUT.set(self.checked_out)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+            POOL_CONNECTIONS.set(self.connections)
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+            POOL_CONNECTIONS.set(self.connections)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        logger.warning(f"MongoDB connection pool cleared for {event.address}")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """Records the latency of every MongoDB command"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+        COMMAND_FAILURES.inc(command=event.command_name)
+
+
+class HealthProber:
+    """Pings MongoDB every interval seconds and caches the outcome"""
+
+    def __init__(self, client, interval=5.0, timeout=2.0):
+        self.client = client
+        self.interval = interval
+        self.timeout = timeout
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._result = {'healthy': False, 'latency_ms': None, 'checked_at': None, 'error': 'not probed yet'}
+
+    def start(self):
+        """Probe once synchronously, then keep probing in the background"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.probe()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='mongodb-health', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.interval + self.timeout)
+            self._thread = None
+
+    def probe(self):
+        start = time.perf_counter()
+        try:
+            self.client.admin.command('ping', maxTimeMS=int(self.timeout * 1000))
+            result = {'healthy': True, 'error': None}
+        except Exception as e:
+            result = {'healthy': False, 'error': str(e)}
+        result['latency_ms'] = (time.perf_counter() - start) * 1000
+        result['checked_at'] = datetime.utcnow().isoformat()
+        with self._lock:
+            if result['healthy'] != self._result['healthy'] and self._result['checked_at'] is not None:
+                logger.warning(f"MongoDB health changed: healthy={result['healthy']} {result['error'] or ''}")
+            self._result = result
+        return result
+
+    @property
+    def healthy(self):
+        with self._lock:
+            return self._result['healthy']
+
+    def status(self):
+        with self._lock:
+            return dict(self._result)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.probe()
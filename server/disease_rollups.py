@@ -0,0 +1,237 @@
+"""
+Disease prevalence rollups from crop_health diagnoses
+
+Each diagnosis is counted once, under its top result's label, in the
+disease_rollups document for its (location, UTC day, label):
+
+    {'location': 'Nashik', 'day': <midnight UTC>, 'label': 'Tomato___Late_blight',
+     'count': 42, 'confidenceSum': 35.7}
+
+Mean confidence is confidenceSum / count. Locations sent as text are used
+as they are, trimmed. {'lat', 'lng'} locations are snapped to a
+LOCATION_GRID-degree cell ("19.9,73.8"). Diagnoses without a location or
+results are not counted.
+
+Inserts are counted incrementally through a CounterBuffer (upserted $inc,
+flushed in batches). rebuild() recomputes a date range from crop_health
+and writes it over the live rollups with upserts; run it once for existing
+history (scripts/backfill_rollups.py), and again whenever counts need
+reconciling. prevalence() reads a range back as
+dense, heatmap-ready series.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from api_core import to_list
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEY = ('location', 'day', 'label')
+
+# Degrees per grid cell for coordinate locations (0.1 is about 11 km)
+LOCATION_GRID = 0.1
+
+
+class InvalidRangeError(ValueError):
+    """Raised for an unusable date range or filter"""
+    pass
+
+
+def location_key(location):
+    """Rollup location for a diagnosis location, or None"""
+    if isinstance(location, str):
+        return location.strip() or None
+    if isinstance(location, dict):
+        try:
+            lat, lng = float(location['lat']), float(location['lng'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return f"{round(lat / LOCATION_GRID) * LOCATION_GRID:.1f},{round(lng / LOCATION_GRID) * LOCATION_GRID:.1f}"
+    return None
+
+
+def day_of(timestamp):
+    """Midnight (UTC) of the day a naive UTC datetime falls on"""
+    return datetime(timestamp.year, timestamp.month, timestamp.day)
+
+
+def rollup_entry(doc):
+    """((location, day, label), confidence) for a diagnosis, or None if it isn't counted"""
+    location = location_key(doc.get('location'))
+    timestamp = doc.get('timestamp')
+    results = doc.get('results')
+    if location is None or not isinstance(timestamp, datetime) or not isinstance(results, list):
+        return None
+    top = None
+    for result in results:
+        if not isinstance(result, dict) or not isinstance(result.get('label'), str):
+            continue
+        try:
+            confidence = float(result.get('confidence', 0))
+        except (TypeError, ValueError):
+            continue
+        if top is None or confidence > top[1]:
+            top = (result['label'], confidence)
+    if top is None:
+        return None
+    return (location, day_of(timestamp), top[0]), top[1]
+
+
+def record(buffer, docs):
+    """Count newly inserted diagnoses into a CounterBuffer keyed by ROLLUP_KEY"""
+    for doc in docs:
+        entry = rollup_entry(doc)
+        if entry is None:
+            continue
+        key, confidence = entry
+        buffer.add(key, 'count', 1)
+        buffer.add(key, 'confidenceSum', confidence)
+
+
+def rebuild(db, start=None, end=None, batch_size=1000, settle=60.0):
+    """Recompute the rollups of days in [start, end) from crop_health
+
+    start and end are rounded down to whole days; without start, all history
+    before end is rebuilt. Totals are written over the existing rollups with
+    upserts, and rollups left without diagnoses are deleted, so the range is
+    never empty while it runs.
+
+    The servers keep counting diagnoses into the same documents (offline
+    uploads of past days). A rollup is skipped, left as it is, if a server
+    updates it during the rebuild, or if one of its diagnoses was stored in
+    the last settle seconds, since that diagnosis's change may still be
+    waiting in a server's buffer and would be added again on top of the
+    rebuilt total. settle must exceed the rollup flush interval plus
+    write-behind delays. Running it again reconciles skipped rollups.
+    Returns (diagnoses read, rollups written, rollups skipped).
+    """
+    query = {}
+    if start is not None:
+        start = day_of(start)
+        query['$gte'] = start
+    end = day_of(end or datetime.utcnow())
+    query['$lt'] = end
+
+    # Rollups updated after this may count diagnoses the pass below missed
+    started = datetime.utcnow()
+    # Diagnoses stored after this may not have been flushed to their rollup yet
+    settled = started - timedelta(seconds=settle)
+
+    # One pass over the range; the aggregate is small (locations x days x labels)
+    totals = {}
+    unsettled = set()
+    read = 0
+    cursor = db.crop_health.find(
+        {'timestamp': query}, {'_id': 0, 'results': 1, 'location': 1, 'timestamp': 1, 'createdAt': 1}
+    ).batch_size(batch_size)
+    for doc in cursor:
+        read += 1
+        entry = rollup_entry(doc)
+        if entry is None:
+            continue
+        key, confidence = entry
+        created = doc.get('createdAt')
+        if isinstance(created, datetime) and created >= settled:
+            unsettled.add(key)
+        count, confidence_sum = totals.get(key, (0, 0.0))
+        totals[key] = (count + 1, confidence_sum + confidence)
+
+    day_range = {'$lt': end}
+    if start is not None:
+        day_range['$gte'] = start
+    touched = set(unsettled)
+    stale = []
+    for doc in db.disease_rollups.find({'day': day_range}, {'updatedAt': 1, **{field: 1 for field in ROLLUP_KEY}}):
+        key = tuple(doc.get(field) for field in ROLLUP_KEY)
+        updated = doc.get('updatedAt')
+        if updated is not None and updated >= started:
+            touched.add(key)
+        elif key not in totals:
+            stale.append(doc['_id'])
+
+    # Each write re-checks updatedAt, so a flush landing between the check
+    # above and the write is kept too (a missing document counts as stale)
+    fresh = {'$lt': ['$updatedAt', started]}
+    now = datetime.utcnow()
+    requests = [
+        UpdateOne(dict(zip(ROLLUP_KEY, key)), [{'$set': {
+            'count': {'$cond': [fresh, count, '$count']},
+            'confidenceSum': {'$cond': [fresh, confidence_sum, '$confidenceSum']},
+            'updatedAt': {'$cond': [fresh, now, '$updatedAt']},
+        }}], upsert=True)
+        for key, (count, confidence_sum) in totals.items() if key not in touched
+    ]
+    for i in range(0, len(requests), batch_size):
+        db.disease_rollups.bulk_write(requests[i:i + batch_size], ordered=False)
+    for i in range(0, len(stale), batch_size):
+        db.disease_rollups.delete_many({'_id': {'$in': stale[i:i + batch_size]}, 'updatedAt': {'$lt': started}})
+
+    if touched:
+        logger.warning(f"Left {len(touched)} disease rollups updated during the rebuild, or with "
+                       f"recent diagnoses, as they were")
+    logger.info(f"Rebuilt {len(requests)} disease rollups from {read} diagnoses, removed {len(stale)}")
+    return read, len(requests), len(touched)
+
+
+def parse_day(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise InvalidRangeError(f"{name} must be a date (YYYY-MM-DD)")
+
+
+def parse_range(args, default_days=30, max_days=366):
+    """(first day, last day) from from=/to= query parameters, inclusive"""
+    today = day_of(datetime.utcnow())
+    last = parse_day(args['to'], 'to') if args.get('to') else today
+    first = parse_day(args['from'], 'from') if args.get('from') else last - timedelta(days=default_days - 1)
+    if first > last:
+        raise InvalidRangeError('from must not be after to')
+    if (last - first).days + 1 > max_days:
+        raise InvalidRangeError(f"At most {max_days} days per request")
+    return first, last
+
+
+def prevalence(collection, first, last, label=None, location=None, limit=100):
+    """Daily counts and mean confidence per (location, label) for days first..last
+
+    A generator that yields its query (see api_core). Series are dense, one
+    value per day (count 0 and meanConfidence None on days without
+    diagnoses), and ordered by total count, largest first.
+    """
+    query = {'day': {'$gte': first, '$lte': last}}
+    if label:
+        query['label'] = label
+    if location:
+        query['location'] = location
+    docs = yield to_list(collection.find(
+        query, {'_id': 0, 'location': 1, 'day': 1, 'label': 1, 'count': 1, 'confidenceSum': 1}
+    ))
+
+    days = (last - first).days + 1
+    series = {}
+    for doc in docs:
+        key = (doc['location'], doc['label'])
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = {
+                'location': doc['location'], 'label': doc['label'], 'total': 0,
+                'counts': [0] * days, 'meanConfidence': [None] * days,
+            }
+        index = (doc['day'] - first).days
+        count = doc.get('count', 0)
+        entry['counts'][index] = count
+        entry['total'] += count
+        if count:
+            entry['meanConfidence'][index] = round(doc.get('confidenceSum', 0.0) / count, 4)
+
+    ordered = sorted(series.values(), key=lambda entry: (-entry['total'], entry['location'], entry['label']))
+    return {
+        'from': first.date().isoformat(),
+        'to': last.date().isoformat(),
+        'days': [(first + timedelta(days=i)).date().isoformat() for i in range(days)],
+        'series': ordered[:limit],
+        'truncated': len(ordered) > limit,
+    }
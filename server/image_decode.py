@@ -0,0 +1,118 @@
+"""
+Image decoding pipeline for model inputs
+
+JPEG uploads are decoded with PIL's draft mode, which lets libjpeg scale the
+image down by 1/2, 1/4 or 1/8 during decoding instead of materialising the
+full 12 MP bitmap and resizing it afterwards. Decoding runs on a bounded
+thread pool; PIL releases the GIL inside the decoder so work overlaps across
+requests.
+"""
+import io
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Model input size (width, height)
+IMAGE_SIZE = (160, 160)
+
+
+class ImageRejectedError(ValueError):
+    """Raised when an upload is too large or cannot be decoded"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def decode_image(image_bytes, size=IMAGE_SIZE, max_bytes=None, max_pixels=None):
+    """Decode image bytes to a float32 RGB array of the given size"""
+    if not image_bytes:
+        raise ImageRejectedError('Empty image')
+    if max_bytes and len(image_bytes) > max_bytes:
+        raise ImageRejectedError(
+            f'Image is {len(image_bytes)} bytes (max {max_bytes})', status_code=413
+        )
+
+    try:
+        # Image.open only parses the header; nothing is decoded yet
+        image = Image.open(io.BytesIO(image_bytes))
+    except UnidentifiedImageError:
+        raise ImageRejectedError('Unsupported or malformed image')
+    except Image.DecompressionBombError as e:
+        # PIL refuses headers claiming more than twice Image.MAX_IMAGE_PIXELS
+        raise ImageRejectedError(f'Image is too large to decode: {e}', status_code=413)
+
+    width, height = image.size
+    if max_pixels and width * height > max_pixels:
+        raise ImageRejectedError(
+            f'Image is {width}x{height} pixels (max {max_pixels})', status_code=413
+        )
+
+    try:
+        if image.format == 'JPEG':
+            # Decode at the smallest DCT scale that is still >= the target size
+            image.draft('RGB', size)
+
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        # reducing_gap lets PIL box-reduce large non-JPEG images before resampling
+        image = image.resize(size, Image.BICUBIC, reducing_gap=3.0)
+        return np.asarray(image, dtype=np.float32)
+    except (OSError, SyntaxError, ValueError) as e:
+        raise ImageRejectedError(f'Malformed image: {e}')
+
+
+class DecodePool:
+    """Bounded thread pool for image decoding"""
+
+    def __init__(self, max_workers=4, queue_depth=64, max_bytes=None, max_pixels=None):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='decode')
+        # Caps queued plus running decodes so bursts can't hold unbounded image bytes
+        self._slots = threading.BoundedSemaphore(max_workers + queue_depth)
+
+    def submit(self, image_bytes):
+        """Queue one image for decoding and return a Future"""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(
+                decode_image, image_bytes,
+                max_bytes=self.max_bytes, max_pixels=self.max_pixels
+            )
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def decode(self, image_bytes):
+        """Decode one image on the pool and wait for the result"""
+        return self.submit(image_bytes).result()
+
+    def decode_many(self, images):
+        """Decode images in parallel; failures are returned as exceptions in place"""
+        futures = [
+            None if isinstance(data, Exception) else self.submit(data)
+            for data in images
+        ]
+        results = []
+        for data, future in zip(images, futures):
+            if future is None:
+                results.append(data)
+                continue
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def shutdown(self):
+        """Stop accepting work and wait for running decodes"""
+        self._executor.shutdown(wait=True)
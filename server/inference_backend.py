@@ -0,0 +1,198 @@
+"""
+Inference backends for the plant disease model
+
+Every backend exposes the same contract: predict(batch) takes a float32 array
+of preprocessed images shaped (N, 160, 160, 3) and returns an (N, classes)
+array of model outputs.
+"""
+import os
+import threading
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+KERAS_MODEL_NAME = 'plant_disease_recog_model_pwp.keras'
+QUANTIZATION_MODES = ('float16', 'int8')
+DEFAULT_BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+def find_keras_model_path():
+    """Locate the Keras model in the project root, falling back to the server folder"""
+    candidates = [
+        os.path.join(SERVER_DIR, '..', KERAS_MODEL_NAME),
+        os.path.join(SERVER_DIR, KERAS_MODEL_NAME),
+    ]
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+        print(f"Model not found at: {path}")
+    raise FileNotFoundError(f"Model file not found at {candidates[-1]}")
+
+
+def default_tflite_path(quantization):
+    """Where convert_to_tflite.py writes the model for a quantization mode"""
+    base = os.path.splitext(KERAS_MODEL_NAME)[0]
+    return os.path.join(SERVER_DIR, '..', f"{base}.{quantization}.tflite")
+
+
+class KerasBackend:
+    """Full TensorFlow Keras model behind pre-traced, fixed-shape tf.functions
+
+    model.predict() builds a data adapter and callback list on every call,
+    which dominates single-image latency. Instead one concrete function is
+    traced per batch-size bucket at load time; a batch is zero-padded up to
+    the nearest bucket and the padding rows are dropped from the output.
+    """
+    name = 'keras'
+
+    def __init__(self, model_path, batch_buckets=DEFAULT_BATCH_BUCKETS):
+        import tensorflow as tf
+
+        self._tf = tf
+        self.model_path = model_path
+        self.model = tf.keras.models.load_model(model_path)
+        self.input_shape = self.model.input_shape
+        self.output_shape = self.model.output_shape
+        self.batch_buckets = sorted(set(int(b) for b in batch_buckets if int(b) > 0)) or [1]
+
+        sample_shape = tuple(dim or default for dim, default in zip(self.input_shape[1:], (160, 160, 3)))
+        self._functions = {}
+        for size in self.batch_buckets:
+            fn = tf.function(
+                lambda x: self.model(x, training=False),
+                input_signature=[tf.TensorSpec((size,) + sample_shape, tf.float32)]
+            )
+            # Tracing happens here rather than on the first request
+            self._functions[size] = fn.get_concrete_function()
+
+    def _bucket_for(self, n):
+        for size in self.batch_buckets:
+            if size >= n:
+                return size
+        return self.batch_buckets[-1]
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        max_bucket = self.batch_buckets[-1]
+        outputs = []
+        for start in range(0, batch.shape[0], max_bucket):
+            chunk = batch[start:start + max_bucket]
+            n = chunk.shape[0]
+            bucket = self._bucket_for(n)
+            if bucket > n:
+                padding = np.zeros((bucket - n,) + chunk.shape[1:], dtype=np.float32)
+                chunk = np.concatenate([chunk, padding], axis=0)
+            result = self._functions[bucket](self._tf.convert_to_tensor(chunk))
+            outputs.append(result.numpy()[:n])
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs, axis=0)
+
+    def predict_legacy(self, batch):
+        """The original model.predict() path, kept for benchmarking"""
+        return self.model.predict(batch, verbose=0)
+
+
+def _tflite_interpreter_class():
+    """Prefer the standalone tflite_runtime package on edge boxes"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteBackend:
+    """Quantized TensorFlow Lite model (float16 or int8 weights)"""
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=None, model_content=None):
+        Interpreter = _tflite_interpreter_class()
+
+        self.model_path = model_path
+        if model_content is not None:
+            # The interpreter reads weights from this buffer in place, so a
+            # buffer loaded before fork() is shared copy-on-write by workers
+            self.interpreter = Interpreter(model_content=model_content, num_threads=num_threads)
+        else:
+            self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple([None] + list(self._input['shape'][1:]))
+        self.output_shape = tuple([None] + list(self._output['shape'][1:]))
+        self._batch_size = int(self._input['shape'][0])
+        # An interpreter holds its tensors in place, so calls must not overlap
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        if batch_size == self._batch_size:
+            return
+        shape = [batch_size] + list(self._input['shape'][1:])
+        self.interpreter.resize_tensor_input(self._input['index'], shape)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def predict(self, batch):
+        with self._lock:
+            self._resize(batch.shape[0])
+
+            inputs = batch
+            if self._input['dtype'] != np.float32:
+                # Fully integer model: quantize inputs with the tensor's scale
+                scale, zero_point = self._input['quantization']
+                inputs = np.round(batch / scale + zero_point).astype(self._input['dtype'])
+            self.interpreter.set_tensor(self._input['index'], inputs)
+            self.interpreter.invoke()
+            outputs = self.interpreter.get_tensor(self._output['index'])
+
+            if self._output['dtype'] != np.float32:
+                scale, zero_point = self._output['quantization']
+                outputs = (outputs.astype(np.float32) - zero_point) * scale
+            return np.array(outputs, copy=True)
+
+
+def resolve_model_path(name='keras', quantization='float16', tflite_path=None):
+    """Path of the model file a backend would load, without importing TensorFlow"""
+    if name == 'keras':
+        return find_keras_model_path()
+
+    if name == 'tflite':
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown TFLite quantization '{quantization}' (expected one of {QUANTIZATION_MODES})")
+        path = tflite_path or default_tflite_path(quantization)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"TFLite model not found at {path}. "
+                f"Generate it with: python scripts/convert_to_tflite.py --quantization {quantization}"
+            )
+        return path
+
+    raise ValueError(f"Unknown inference backend '{name}' (expected 'keras' or 'tflite')")
+
+
+def configure_threads(intra_op_threads=0, inter_op_threads=0):
+    """Limit TensorFlow's thread pools; must run before the first TF op"""
+    if not intra_op_threads and not inter_op_threads:
+        return
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return
+    if intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
+def load_backend(name='keras', quantization='float16', tflite_path=None, num_threads=None,
+                 batch_buckets=DEFAULT_BATCH_BUCKETS, model_content=None):
+    """Load the configured inference backend"""
+    path = resolve_model_path(name, quantization, tflite_path)
+    if name == 'keras':
+        return KerasBackend(path, batch_buckets=batch_buckets)
+    return TFLiteBackend(path, num_threads=num_threads, model_content=model_content)
@@ -0,0 +1,139 @@
+"""
+Multi-process inference worker pool
+
+A single Python process can't use more than one core for the GIL-bound
+parts of inference, and it shares that core with the MongoDB routes. In
+production the server forks a fixed number of inference workers, each with
+its own backend and bounded TensorFlow thread pools, and feeds them batches
+over a local queue.
+
+Workers are forked when the pool is created, before the parent has
+imported TensorFlow (whose runtime is not fork-safe). For the TFLite backend
+the model file is read once in the parent before forking, and every worker's
+interpreter uses that buffer in place, so the weights are shared
+copy-on-write. The Keras backend has to be loaded in each worker.
+"""
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from inference_backend import load_backend, resolve_model_path, configure_threads
+
+logger = logging.getLogger(__name__)
+
+# Per-worker state, set by _init_worker in each child process
+_backend = None
+_preprocess_input = None
+_init_error = None
+
+
+def _init_worker(backend_kwargs, intra_op_threads, inter_op_threads):
+    global _backend, _preprocess_input, _init_error
+    try:
+        if backend_kwargs['name'] == 'keras':
+            configure_threads(intra_op_threads, inter_op_threads)
+        elif intra_op_threads:
+            backend_kwargs = dict(backend_kwargs, num_threads=intra_op_threads)
+        _backend = load_backend(**backend_kwargs)
+
+        try:
+            from tensorflow.keras.applications.efficientnet import preprocess_input
+        except ImportError:
+            # EfficientNet's preprocess_input is a pass-through
+            preprocess_input = lambda x: x
+        _preprocess_input = preprocess_input
+    except Exception as e:
+        _init_error = f"{type(e).__name__}: {e}"
+
+
+def _worker_info():
+    if _init_error is not None:
+        raise RuntimeError(f"Inference worker failed to load model: {_init_error}")
+    return {
+        'pid': os.getpid(),
+        'input_shape': tuple(_backend.input_shape),
+        'output_shape': tuple(_backend.output_shape),
+    }
+
+
+def _worker_predict(batch):
+    if _init_error is not None:
+        raise RuntimeError(f"Inference worker failed to load model: {_init_error}")
+    return _backend.predict(_preprocess_input(batch))
+
+
+def _worker_rss_kb():
+    """Resident set size of this worker in KiB (Linux only)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return os.getpid(), int(line.split()[1])
+    except OSError:
+        pass
+    return os.getpid(), None
+
+
+class InferencePool:
+    """Pool of inference processes with the same predict() contract as a backend
+
+    Inputs are decoded, resized images; workers apply preprocess_input
+    themselves so the parent process never needs TensorFlow.
+    """
+    name = 'pool'
+    applies_preprocessing = True
+
+    def __init__(self, workers, backend='keras', quantization='float16', tflite_path=None,
+                 batch_buckets=None, intra_op_threads=0, inter_op_threads=0):
+        self.workers = max(1, int(workers))
+        self.backend_name = backend
+        self.model_path = resolve_model_path(backend, quantization, tflite_path)
+
+        backend_kwargs = {
+            'name': backend,
+            'quantization': quantization,
+            'tflite_path': tflite_path,
+        }
+        if batch_buckets:
+            backend_kwargs['batch_buckets'] = batch_buckets
+        if backend == 'tflite':
+            # Read once here; forked workers share these pages
+            with open(self.model_path, 'rb') as f:
+                backend_kwargs['model_content'] = f.read()
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(backend_kwargs, intra_op_threads, inter_op_threads)
+        )
+        # With fork, the first submit starts every worker at once
+        self._info = self._executor.submit(_worker_info)
+        self.input_shape = None
+        self.output_shape = None
+        logger.info(
+            f"Started {self.workers} inference workers ({backend}, "
+            f"intra_op_threads={intra_op_threads or 'auto'}, inter_op_threads={inter_op_threads or 'auto'})"
+        )
+
+    def wait_ready(self, timeout=None):
+        """Block until a worker has loaded the model; raises if loading failed"""
+        info = self._info.result(timeout=timeout)
+        self.input_shape = info['input_shape']
+        self.output_shape = info['output_shape']
+        return info
+
+    def predict(self, batch):
+        return self._executor.submit(_worker_predict, batch).result()
+
+    def memory_usage(self):
+        """Best-effort RSS per worker in KiB; a worker busy with a long batch may be missed"""
+        futures = [self._executor.submit(_worker_rss_kb) for _ in range(self.workers * 2)]
+        return dict(f.result() for f in futures)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
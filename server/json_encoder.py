@@ -0,0 +1,64 @@
+"""
+One-pass JSON encoding for MongoDB documents
+
+API routes return documents straight from MongoDB. Instead of first copying
+each document into JSON-safe types and then encoding the copy, the encoder
+handles BSON types (ObjectId, datetime, Decimal128) while it writes the
+output bytes. orjson is used when installed; otherwise the standard library
+json module with the same type handling.
+"""
+import json
+import logging
+from datetime import date, datetime
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    """Encode the types neither JSON library handles natively"""
+    if isinstance(value, (ObjectId, Decimal128)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return _default(value)
+
+
+def _dumps_orjson(obj):
+    # orjson writes naive and aware datetimes exactly as isoformat() does
+    return orjson.dumps(obj, default=_default)
+
+
+def _dumps_stdlib(obj):
+    return json.dumps(obj, default=_stdlib_default, separators=(',', ':')).encode()
+
+
+ENCODERS = {'json': _dumps_stdlib}
+if orjson is not None:
+    ENCODERS['orjson'] = _dumps_orjson
+
+
+def get_encoder(name='auto'):
+    """Return (name, dumps) for the requested encoder; 'auto' prefers orjson"""
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in ENCODERS else 'json'
+    if name not in ENCODERS:
+        logger.warning(f"JSON encoder '{name}' is not available, using the standard library")
+        name = 'json'
+    return name, ENCODERS[name]
+
+
+ENCODER_NAME, dumps = get_encoder(Config.JSON_ENCODER)
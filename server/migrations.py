@@ -0,0 +1,149 @@
+"""
+Versioned database migrations
+
+Each migration runs once per database; applied versions are recorded in the
+schema_migrations collection. create_indexes() describes the indexes a fresh
+database needs, and migrations bring existing databases in line with it
+(for example by dropping indexes that create_indexes() no longer creates).
+"""
+from datetime import datetime
+import logging
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# MongoDB error codes
+INDEX_NOT_FOUND = 27
+NAMESPACE_NOT_FOUND = 26
+DUPLICATE_KEY = 11000
+
+
+class MigrationError(Exception):
+    """Raised when a migration can't be applied without changing user data"""
+    pass
+
+
+def drop_index_if_exists(collection, name):
+    """Drop an index by name, ignoring indexes or collections that don't exist"""
+    if name not in collection.index_information():
+        return False
+    try:
+        collection.drop_index(name)
+    except OperationFailure as e:
+        # Dropped concurrently by another instance
+        if e.code in (INDEX_NOT_FOUND, NAMESPACE_NOT_FOUND):
+            return False
+        raise
+    logger.info(f"Dropped index {collection.name}.{name}")
+    return True
+
+
+def _001_compound_route_indexes(db):
+    """Replace single-field and duplicate indexes with the compound indexes routes use"""
+    # The compound indexes are created by create_indexes(); make sure they
+    # exist before dropping anything they replace
+    db.posts.create_index([("timestamp", -1), ("_id", -1)])
+    db.comments.create_index([("postId", 1), ("timestamp", 1)])
+    db.activities.create_index([("userId", 1), ("timestamp", -1), ("_id", -1)])
+    db.chat_messages.create_index([("chatId", 1), ("timestamp", 1), ("_id", 1)])
+    db.crop_health.create_index([("userId", 1), ("timestamp", -1), ("_id", -1)])
+
+    redundant = {
+        # timestamp was indexed both ascending and descending; the feed
+        # index (timestamp, _id) serves both directions
+        'posts': ['timestamp_1', 'timestamp_-1'],
+        # Prefixes of (postId, timestamp); no route filters on timestamp alone
+        'comments': ['postId_1', 'timestamp_1'],
+        # userId is a prefix of the compound index; no route queries date
+        'activities': ['userId_1', 'date_1', 'date_-1'],
+        'chat_messages': ['chatId_1', 'timestamp_1'],
+        'crop_health': ['userId_1', 'timestamp_1'],
+    }
+    for collection, names in redundant.items():
+        for name in names:
+            drop_index_if_exists(db[collection], name)
+
+
+def _002_saved_posts_keyset_index(db):
+    """Add _id to the saved-posts index so cursor pages are read in index order"""
+    db.saved_posts.create_index([("userId", 1), ("createdAt", -1), ("_id", -1)])
+    drop_index_if_exists(db.saved_posts, 'userId_1_createdAt_-1')
+
+
+def find_duplicates(collection, fields, limit=20):
+    """Up to limit {'key', 'count', 'ids'} groups of documents sharing fields"""
+    return list(collection.aggregate([
+        {'$group': {'_id': {field: f'${field}' for field in fields},
+                    'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+        {'$limit': limit},
+        {'$project': {'_id': 0, 'key': '$_id', 'count': 1, 'ids': 1}},
+    ], allowDiskUse=True))
+
+
+def create_unique_index_or_report(collection, fields):
+    """Create a unique index on fields; returns the duplicate groups blocking it, if any"""
+    try:
+        collection.create_index([(field, 1) for field in fields], unique=True)
+        return []
+    except DuplicateKeyError:
+        pass
+    except OperationFailure as e:
+        if e.code != DUPLICATE_KEY:
+            raise
+    duplicates = find_duplicates(collection, fields)
+    for group in duplicates:
+        logger.error(
+            f"Duplicate {collection.name} documents for {group['key']}: "
+            f"{group['count']} documents, _ids {group['ids']}"
+        )
+    return duplicates
+
+
+def _003_client_id_unique_indexes(db):
+    """Unique client-supplied ids so offline-sync replays are idempotent"""
+    # Documents are never deleted to make room for an index; the migration
+    # logs the duplicates and stays pending (retried at the next start) until
+    # they are resolved by hand
+    blocked = []
+    for collection, fields in [
+        (db.activities, ["userId", "id"]),
+        (db.chat_messages, ["chatId", "id"]),
+        (db.crop_health, ["userId", "id"]),
+    ]:
+        if create_unique_index_or_report(collection, fields):
+            blocked.append(f"{collection.name} ({', '.join(fields)})")
+    if blocked:
+        raise MigrationError(f"Duplicate documents block unique indexes on {'; '.join(blocked)}")
+
+
+# (version, function) in the order they must run
+MIGRATIONS = [
+    (1, _001_compound_route_indexes),
+    (2, _002_saved_posts_keyset_index),
+    (3, _003_client_id_unique_indexes),
+]
+
+
+def applied_versions(db):
+    return {doc['_id'] for doc in db.schema_migrations.find({}, {'_id': 1})}
+
+
+def run_migrations(db):
+    """Apply every migration not yet recorded in schema_migrations"""
+    done = applied_versions(db)
+    applied = []
+    for version, migration in MIGRATIONS:
+        if version in done:
+            continue
+        logger.info(f"Applying migration {version}: {migration.__doc__}")
+        migration(db)
+        db.schema_migrations.insert_one({
+            '_id': version,
+            'name': migration.__name__.lstrip('_'),
+            'description': migration.__doc__,
+            'appliedAt': datetime.utcnow()
+        })
+        applied.append(version)
+    return applied
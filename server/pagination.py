@@ -0,0 +1,135 @@
+"""
+Keyset (cursor) pagination helpers
+
+List routes sort on (<timestamp field>, _id). The cursor is an opaque token
+holding the sort key of the last document returned; the next page starts
+strictly after it, so MongoDB seeks straight to it through the index instead
+of skipping over every earlier document.
+
+paginate() and CachedCount.get() are generators that yield their MongoDB
+calls (see api_core); handlers call them with `yield from`.
+"""
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from api_core import to_list
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a client sends a malformed pagination cursor"""
+    pass
+
+
+def encode_cursor(doc, field):
+    """Build the opaque cursor pointing just past doc"""
+    value = doc[field]
+    payload = {
+        'v': value.isoformat() if isinstance(value, datetime) else value,
+        'd': isinstance(value, datetime),
+        'id': str(doc['_id']),
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (sort value, ObjectId) from a cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        value = payload['v']
+        if payload.get('d'):
+            value = datetime.fromisoformat(value)
+        return value, ObjectId(payload['id'])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise InvalidCursorError('Invalid cursor')
+
+
+def keyset_filter(field, direction, cursor):
+    """Query matching documents that sort strictly after the cursor"""
+    value, last_id = decode_cursor(cursor)
+    op = '$lt' if direction < 0 else '$gt'
+    return {'$or': [
+        {field: {op: value}},
+        {field: value, '_id': {op: last_id}},
+    ]}
+
+
+def paginate(collection, query, field, direction, limit, cursor=None, page=1, projection=None):
+    """Fetch one page sorted on (field, _id)
+
+    With a cursor, the page starts after it. Without one, the legacy page
+    number is honoured with skip() so existing clients keep working.
+    Returns (documents, next cursor or None).
+    """
+    if cursor:
+        after = keyset_filter(field, direction, cursor)
+        query = {'$and': [query, after]} if query else after
+    find = collection.find(query, projection).sort([(field, direction), ('_id', direction)])
+    if not cursor and page > 1:
+        find = find.skip((page - 1) * limit)
+    # One extra document tells us whether there is a next page
+    docs = yield to_list(find.limit(limit + 1))
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], field)
+
+
+def paginate_pipeline(collection, match, field, direction, limit, cursor=None, page=1, stages=()):
+    """Like paginate(), as an aggregation: the page is cut first, then stages run on it
+
+    stages (e.g. a $lookup) only see the documents of the page. They must keep
+    field and _id, which the next cursor is built from.
+    """
+    if cursor:
+        after = keyset_filter(field, direction, cursor)
+        match = {'$and': [match, after]} if match else after
+    pipeline = [{'$match': match}, {'$sort': {field: direction, '_id': direction}}]
+    if not cursor and page > 1:
+        pipeline.append({'$skip': (page - 1) * limit})
+    pipeline.append({'$limit': limit + 1})
+    pipeline.extend(stages)
+    docs = yield to_list(collection.aggregate(pipeline))
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], field)
+
+
+class CachedCount:
+    """Collection size from estimated_document_count(), refreshed at most every ttl seconds
+
+    Documents matching exclude (counted exactly, so it should be selective
+    and indexed) are subtracted from the estimate.
+    """
+
+    def __init__(self, get_collection, ttl=60, exclude=None):
+        self.get_collection = get_collection
+        self.ttl = ttl
+        self.exclude = exclude
+        self._value = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is not None and time.monotonic() < self._expires_at:
+            return self._value
+        collection = self.get_collection()
+        # Reads collection metadata instead of scanning documents
+        value = yield collection.estimated_document_count()
+        if self.exclude is not None:
+            value = max(0, value - (yield collection.count_documents(self.exclude)))
+        with self._lock:
+            self._value = value
+            self._expires_at = time.monotonic() + self.ttl
+        return value
+
+    def invalidate(self):
+        self._expires_at = 0.0
@@ -3,61 +3,99 @@ Plant Disease Recognition API Server
 A lightweight Flask server for hosting the TensorFlow model and MongoDB backend
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import tensorflow as tf
+from datetime import datetime
 import numpy as np
-from PIL import Image
-import io
 import base64
 import os
+import time
+import random
+import threading
 import logging
 
 # Import MongoDB modules
 from config import Config
-from database import connect_to_database, check_connection, close_connection
-from api_routes import api as api_blueprint
+from database import connect_to_database, check_connection, close_connection, get_database, database_stats
+from api_routes import (
+    api as api_blueprint, response_cache, search_cache, post_cascade, post_counters, rollup_counters
+)
+from disease_rollups import record as record_rollups
+from batching import BatchScheduler, QueueFullError
+from cache import PredictionCache
+from image_decode import DecodePool, ImageRejectedError, IMAGE_SIZE
+from inference_backend import load_backend
+from inference_pool import InferencePool
+from metrics import REGISTRY, instrument
+from models import CropHealth
+from write_behind import WriteBehindQueue
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=getattr(logging, Config.LOG_LEVEL, logging.INFO))
 logger = logging.getLogger(__name__)
 
+# Reference point for startup timings
+_process_start = time.perf_counter()
+
 app = Flask(__name__)
 app.config.from_object(Config)
 CORS(app)
 
 # Register API blueprint
 app.register_blueprint(api_blueprint)
+instrument(app)
+
+PREDICT_STAGE_SECONDS = REGISTRY.histogram(
+    'farmsphere_predict_stage_seconds', 'Time spent in each prediction pipeline stage',
+    ['route', 'stage']
+)
 
 # Global variables
 model = None
+model_state = 'not_started'  # not_started, loading, ready, failed
+model_version = None
 class_names = []
+prediction_cache = None
+batch_scheduler = None
+inference_pool = None
+history_writer = None
+startup_timings = {}
+_preprocess_input = None
+decode_pool = DecodePool(
+    max_workers=Config.DECODE_WORKERS,
+    queue_depth=Config.DECODE_QUEUE_DEPTH,
+    max_bytes=Config.MAX_IMAGE_BYTES,
+    max_pixels=Config.MAX_IMAGE_PIXELS
+)
 
 def load_model():
-    """Load the TensorFlow Keras model"""
-    global model, class_names
+    """Load the configured inference backend and class names"""
+    global model, model_version, class_names
     
     try:
-        # Load the Keras model from project root
-        model_path = os.path.join(os.path.dirname(__file__), '..', 'plant_disease_recog_model_pwp.keras')
-        
-        if not os.path.exists(model_path):
-            print(f"Model not found at: {model_path}")
-            # Try alternative path
-            model_path = os.path.join(os.path.dirname(__file__), 'plant_disease_recog_model_pwp.keras')
-        
-        if not os.path.exists(model_path):
-            print(f"Model not found at: {model_path}")
-            raise FileNotFoundError(f"Model file not found at {model_path}")
+        if inference_pool is not None:
+            # Worker processes load the model themselves
+            inference_pool.wait_ready()
+            model = inference_pool
+        else:
+            # Load the Keras model, or its quantized TFLite conversion
+            model = load_backend(
+                Config.INFERENCE_BACKEND,
+                quantization=Config.TFLITE_QUANTIZATION,
+                tflite_path=Config.TFLITE_MODEL_PATH or None,
+                num_threads=Config.TFLITE_NUM_THREADS or None,
+                batch_buckets=Config.INFERENCE_BATCH_BUCKETS
+            )
+        model_path = model.model_path
+        print(f"Model loaded successfully from: {model_path} (backend: {model.name})")
         
-        # Load the Keras model
-        model = tf.keras.models.load_model(model_path)
-        print(f"Model loaded successfully from: {model_path}")
+        # Identify the model build so cached predictions never outlive it
+        stat = os.stat(model_path)
+        model_version = Config.MODEL_VERSION or f"{os.path.basename(model_path)}:{int(stat.st_mtime)}:{stat.st_size}"
         
         # Print model info
         print(f"Model input shape: {model.input_shape}")
         print(f"Model output shape: {model.output_shape}")
-        print(f"Model input layers: {[layer.name for layer in model.inputs]}")
         
         # Load class names from the JSON file
         import json
@@ -88,85 +126,379 @@ def load_model():
         import traceback
         traceback.print_exc()
 
-def preprocess_image(image_bytes):
-    """Preprocess image using EfficientNet preprocessing"""
-    # Load image from bytes using PIL
-    image = Image.open(io.BytesIO(image_bytes))
+def _record_startup(event):
+    """Log the time from process start to a startup milestone, once"""
+    if event not in startup_timings:
+        startup_timings[event] = round(time.perf_counter() - _process_start, 3)
+        logger.info(f"Startup: {event} after {startup_timings[event]:.3f}s")
+
+def warmup_model():
+    """Run dummy inferences at the expected batch sizes to trigger graph tracing"""
+    input_shape = tuple(
+        dim or default
+        for dim, default in zip(model.input_shape[1:], (IMAGE_SIZE[1], IMAGE_SIZE[0], 3))
+    )
+    for batch_size in Config.WARMUP_BATCH_SIZES:
+        start = time.perf_counter()
+        run_inference(np.zeros((batch_size,) + input_shape, dtype=np.float32))
+        logger.info(f"Warmup batch size {batch_size}: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+def _load_model_in_background():
+    """Load, warm up and start serving the model off the request path"""
+    global model_state
+    
+    start = time.perf_counter()
+    load_model()
+    if model is None:
+        model_state = 'failed'
+        return
+    loaded = time.perf_counter()
     
-    # Resize to match model input
-    image = image.resize((160, 160))
+    try:
+        warmup_model()
+    except Exception as e:
+        logger.warning(f"Model warmup failed: {e}")
+    warmed = time.perf_counter()
     
-    # Convert to RGB if necessary
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
+    init_prediction_cache()
+    start_batch_scheduler()
+    model_state = 'ready'
+    logger.info(f"Model ready (load {loaded - start:.1f}s, warmup {warmed - loaded:.1f}s)")
+    _record_startup('model_ready')
+
+def start_model_loader():
+    """Start loading the model in a background thread"""
+    global model_state
     
-    # Convert to numpy array
-    img_array = np.array(image).astype(np.float32)
+    model_state = 'loading'
+    thread = threading.Thread(target=_load_model_in_background, name='model-loader', daemon=True)
+    thread.start()
+    return thread
+
+def _model_unavailable():
+    """Error response for prediction requests that arrive before the model is ready"""
+    if model_state == 'ready':
+        return None
+    if model_state == 'loading':
+        return jsonify({'error': 'Model is loading, try again shortly'}), 503
+    return jsonify({'error': 'Model not loaded'}), 500
+
+def start_inference_pool(workers):
+    """Fork inference worker processes; call before anything imports TensorFlow"""
+    global inference_pool
+    
+    inference_pool = InferencePool(
+        workers,
+        backend=Config.INFERENCE_BACKEND,
+        quantization=Config.TFLITE_QUANTIZATION,
+        tflite_path=Config.TFLITE_MODEL_PATH or None,
+        batch_buckets=Config.INFERENCE_BATCH_BUCKETS,
+        intra_op_threads=Config.TF_INTRA_OP_THREADS,
+        inter_op_threads=Config.TF_INTER_OP_THREADS
+    )
+    return inference_pool
+
+def run_inference(batch):
+    """Run a single forward pass over a stacked batch of preprocessed images"""
+    return model.predict(batch)
+
+def start_batch_scheduler():
+    """Start the micro-batching scheduler in front of the model"""
+    global batch_scheduler
+    
+    if model is None or batch_scheduler is not None:
+        return
+    
+    batch_scheduler = BatchScheduler(
+        run_inference,
+        max_batch_size=Config.BATCH_MAX_SIZE,
+        window_ms=Config.BATCH_WINDOW_MS,
+        queue_depth=Config.BATCH_QUEUE_DEPTH,
+        max_inflight=inference_pool.workers if inference_pool is not None else 1
+    )
+    batch_scheduler.start()
+
+def preprocess_batch(img_arrays):
+    """Stack decoded images and apply EfficientNet preprocessing in one call"""
+    global _preprocess_input
+    
+    batch = np.stack(img_arrays, axis=0)
+    
+    # Inference workers preprocess on their side, keeping TensorFlow out of this process
+    if getattr(model, 'applies_preprocessing', False):
+        return batch
+    
+    # Imported lazily so startup doesn't wait on TensorFlow
+    if _preprocess_input is None:
+        try:
+            from tensorflow.keras.applications.efficientnet import preprocess_input
+        except ImportError:
+            # tflite_runtime-only install; EfficientNet's preprocess_input is a
+            # pass-through because rescaling is built into the model
+            preprocess_input = lambda x: x
+        _preprocess_input = preprocess_input
     
     # Use EfficientNet's preprocessing function
-    # This normalizes images to [-1, 1] range
-    img_array = tf.keras.applications.efficientnet.preprocess_input(img_array)
+    return _preprocess_input(batch)
+
+def init_prediction_cache():
+    """Create the prediction cache, backed by MongoDB when configured"""
+    global prediction_cache
+    
+    if Config.PREDICTION_CACHE_SIZE <= 0:
+        return
     
-    # Add batch dimension
-    img_array = np.expand_dims(img_array, axis=0)
+    shared_collection = None
+    if Config.PREDICTION_CACHE_SHARED:
+        try:
+            shared_collection = get_database().prediction_cache
+        except Exception as e:
+            logger.warning(f"Shared prediction cache unavailable, using local cache only: {e}")
+    
+    prediction_cache = PredictionCache(
+        maxsize=Config.PREDICTION_CACHE_SIZE,
+        ttl=Config.PREDICTION_CACHE_TTL,
+        shared_collection=shared_collection
+    )
+
+def start_history_writer():
+    """Start the write-behind queue that records predictions in crop_health"""
+    global history_writer
     
-    return img_array
+    history_writer = WriteBehindQueue(
+        lambda: get_database().crop_health,
+        batch_size=Config.HISTORY_WRITE_BATCH_SIZE,
+        flush_interval=Config.HISTORY_WRITE_INTERVAL,
+        max_queue=Config.HISTORY_WRITE_QUEUE_SIZE,
+        put_timeout=Config.HISTORY_WRITE_PUT_TIMEOUT,
+        # Count written diagnoses into the disease prevalence rollups
+        on_written=lambda docs: record_rollups(rollup_counters, docs)
+    )
+    history_writer.start()
+
+def record_diagnosis(user_id, location, results):
+    """Queue a diagnosis for the user's crop health history without waiting on MongoDB"""
+    diagnosis_doc = CropHealth.create_diagnosis(
+        diagnosis_id=str(datetime.now().timestamp()),
+        user_id=user_id,
+        image_url=None,
+        results=results,
+        location=location
+    )
+    queued = history_writer is not None and history_writer.enqueue(diagnosis_doc)
+    return {'diagnosisId': diagnosis_doc['id'], 'historySaved': queued}
+
+def _log_prediction_sample(predictions):
+    """Log the top-5 classes of one prediction"""
+    top5 = np.argsort(predictions)[-5:][::-1]
+    logger.debug(
+        "Top 5 predictions: " +
+        ", ".join(f"{class_names[idx]} ({idx})={predictions[idx]:.4f}" for idx in top5)
+    )
+
+def decode_predictions(predictions):
+    """Convert one row of model output into the top-3 results list"""
+    # Apply softmax to convert logits to probabilities if needed
+    # Some models output raw logits, some output probabilities already
+    if predictions.min() < 0 or predictions.max() > 1:
+        # Convert from logits to probabilities using softmax
+        from scipy.special import softmax
+        predictions = softmax(predictions)
+    
+    # Sampled and level-controlled, so it costs nothing unless DEBUG is on
+    if (Config.PREDICTION_LOG_SAMPLE_RATE > 0 and logger.isEnabledFor(logging.DEBUG)
+            and random.random() < Config.PREDICTION_LOG_SAMPLE_RATE):
+        _log_prediction_sample(predictions)
+    
+    # Get top 3 predictions (sorted by confidence) without sorting the full vector
+    top_indices = np.argpartition(predictions, -3)[-3:]
+    top_indices = top_indices[np.argsort(predictions[top_indices])[::-1]]
+    
+    results = []
+    for idx in top_indices:
+        confidence = float(predictions[idx])
+        if confidence > 0.1:  # Only include if confidence > 10%
+            results.append({
+                'label': class_names[idx],
+                'confidence': confidence
+            })
+    
+    return results
 
 @app.route('/predict', methods=['POST'])
 def predict():
     """Handle prediction requests"""
-    global model
-    
-    if model is None:
-        return jsonify({'error': 'Model not loaded'}), 500
+    unavailable = _model_unavailable()
+    if unavailable is not None:
+        return unavailable
     
     try:
         # Get image from request
         if 'file' in request.files:
             file = request.files['file']
             image_bytes = file.read()
+            fields = request.form
         elif 'image' in request.json:
             # Base64 encoded image
             image_data = request.json['image']
             image_bytes = base64.b64decode(image_data)
+            fields = request.json
         else:
             return jsonify({'error': 'No image provided'}), 400
         
-        # Preprocess image
-        processed_image = preprocess_image(image_bytes)
+        # Optionally record the diagnosis in the user's history
+        user_id = fields.get('userId')
+        location = fields.get('location')
+        
+        # Identical uploads (retries, re-opens) are answered from the cache
+        cache_key = None
+        if prediction_cache is not None:
+            cache_key = PredictionCache.make_key(image_bytes, model_version)
+            cached = prediction_cache.get(cache_key)
+            if cached is not None:
+                response = {'results': cached}
+                if user_id:
+                    response.update(record_diagnosis(user_id, location, cached))
+                return jsonify(response)
+        
+        # Decode and preprocess image
+        with PREDICT_STAGE_SECONDS.time(route='/predict', stage='decode'):
+            image = decode_pool.decode(image_bytes)
+        with PREDICT_STAGE_SECONDS.time(route='/predict', stage='preprocess'):
+            processed_image = preprocess_batch([image])
         
-        # Run inference with Keras model
-        predictions = model.predict(processed_image, verbose=0)[0]
+        # Run inference, batched with concurrent requests
+        with PREDICT_STAGE_SECONDS.time(route='/predict', stage='inference'):
+            if batch_scheduler is not None:
+                predictions = batch_scheduler.predict(processed_image)[0]
+            else:
+                predictions = run_inference(processed_image)[0]
+        
+        with PREDICT_STAGE_SECONDS.time(route='/predict', stage='postprocess'):
+            results = decode_predictions(predictions)
+        if cache_key is not None:
+            prediction_cache.set(cache_key, results)
+        _record_startup('first_prediction')
+        
+        response = {'results': results}
+        if user_id:
+            response.update(record_diagnosis(user_id, location, results))
+        
+        with PREDICT_STAGE_SECONDS.time(route='/predict', stage='serialization'):
+            return jsonify(response)
+        
+    except ImageRejectedError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+class InvalidBatchError(ValueError):
+    """Raised for a batch request body that isn't a list of images"""
+    pass
+
+def _read_batch_images():
+    """Collect (name, bytes) pairs from a multipart or base64 batch request"""
+    if request.files:
+        files = request.files.getlist('files') or request.files.getlist('file')
+        return [(f.filename, f.read()) for f in files]
+    
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        raise InvalidBatchError('Body must be a JSON object with an images list')
+    encoded = data.get('images') or []
+    if not isinstance(encoded, list):
+        raise InvalidBatchError('images must be a list of base64 strings')
+    images = []
+    for i, image_data in enumerate(encoded):
+        try:
+            images.append((str(i), base64.b64decode(image_data, validate=True)))
+        except Exception as e:
+            images.append((str(i), e))
+    return images
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Handle prediction requests for many images in one call"""
+    unavailable = _model_unavailable()
+    if unavailable is not None:
+        return unavailable
+    
+    try:
+        images = _read_batch_images()
+        if not images:
+            return jsonify({'error': 'No images provided'}), 400
+        if len(images) > Config.PREDICT_BATCH_MAX_IMAGES:
+            return jsonify({
+                'error': f'Too many images (max {Config.PREDICT_BATCH_MAX_IMAGES})'
+            }), 413
         
-        # Apply softmax to convert logits to probabilities if needed
-        # Some models output raw logits, some output probabilities already
-        if predictions.min() < 0 or predictions.max() > 1:
-            # Convert from logits to probabilities using softmax
-            from scipy.special import softmax
-            predictions = softmax(predictions)
+        predictions = [None] * len(images)
+        cache_keys = [None] * len(images)
+        pending = []
+        for i, (_, data) in enumerate(images):
+            if prediction_cache is not None and not isinstance(data, Exception):
+                cache_keys[i] = PredictionCache.make_key(data, model_version)
+                predictions[i] = prediction_cache.get(cache_keys[i])
+            if predictions[i] is None:
+                pending.append(i)
         
-        print(f"Predictions shape: {predictions.shape}")
-        print(f"Top 5 indices: {np.argsort(predictions)[-5:][::-1]}")
-        print(f"Top 5 values: {predictions[np.argsort(predictions)[-5:][::-1]]}")
+        # Decode and resize in parallel; PIL releases the GIL while decoding
+        decoded = [None] * len(images)
+        with PREDICT_STAGE_SECONDS.time(route='/predict/batch', stage='decode'):
+            for i, arr in zip(pending, decode_pool.decode_many([images[i][1] for i in pending])):
+                decoded[i] = arr
         
-        # Get top 3 predictions (sorted by confidence)
-        top_indices = np.argsort(predictions)[-3:][::-1]
+        valid = [i for i in pending if not isinstance(decoded[i], Exception)]
+        if valid:
+            # One preprocessing call and one forward pass for every valid image
+            with PREDICT_STAGE_SECONDS.time(route='/predict/batch', stage='preprocess'):
+                batch = preprocess_batch([decoded[i] for i in valid])
+            with PREDICT_STAGE_SECONDS.time(route='/predict/batch', stage='inference'):
+                outputs = run_inference(batch)
+            with PREDICT_STAGE_SECONDS.time(route='/predict/batch', stage='postprocess'):
+                for row, i in enumerate(valid):
+                    predictions[i] = decode_predictions(outputs[row])
+                    if cache_keys[i] is not None:
+                        prediction_cache.set(cache_keys[i], predictions[i])
         
-        results = []
-        for idx in top_indices:
-            confidence = float(predictions[idx])
-            if confidence > 0.1:  # Only include if confidence > 10%
-                results.append({
-                    'label': class_names[idx],
-                    'confidence': confidence
-                })
-                print(f"Class: {class_names[idx]}, Index: {idx}, Confidence: {confidence:.4f}")
+        response = []
+        for i, (name, _) in enumerate(images):
+            if isinstance(decoded[i], Exception):
+                response.append({'index': i, 'filename': name, 'error': str(decoded[i])})
+            else:
+                response.append({'index': i, 'filename': name, 'results': predictions[i]})
         
-        return jsonify({'results': results})
+        _record_startup('first_prediction')
+        with PREDICT_STAGE_SECONDS.time(route='/predict/batch', stage='serialization'):
+            return jsonify({'predictions': response})
         
+    except InvalidBatchError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.after_request
+def _record_first_response(response):
+    _record_startup('first_response')
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness endpoint: 200 once the model is loaded and warmed up"""
+    is_ready = model_state == 'ready'
+    return jsonify({
+        'ready': is_ready,
+        'model_state': model_state,
+        'startup': startup_timings
+    }), 200 if is_ready else 503
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -174,7 +506,16 @@ def health():
     return jsonify({
         'status': 'ok', 
         'model_loaded': model is not None,
-        'database_connected': db_status
+        'database_connected': db_status,
+        'batching': batch_scheduler.stats() if batch_scheduler is not None else None,
+        'prediction_cache': prediction_cache.stats() if prediction_cache is not None else None,
+        'history_writer': history_writer.stats() if history_writer is not None else None,
+        'response_cache': response_cache.stats(),
+        'search_cache': search_cache.stats(),
+        'post_cascade': post_cascade.stats(),
+        'post_counters': post_counters.stats(),
+        'disease_rollups': rollup_counters.stats(),
+        'database': database_stats()
     })
 
 @app.route('/api/health', methods=['GET'])
@@ -187,6 +528,17 @@ def api_health():
     })
 
 if __name__ == '__main__':
+    production = Config.SERVING_MODE == 'production'
+    debug = Config.DEBUG and not production
+    # With the debug reloader only the child process serves requests
+    serving_process = not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    
+    # Fork inference workers before MongoDB client threads or TensorFlow exist
+    workers = Config.INFERENCE_WORKERS or ((os.cpu_count() or 1) if production else 0)
+    if workers and serving_process:
+        logger.info(f"Starting {workers} inference workers...")
+        start_inference_pool(workers)
+    
     try:
         # Connect to MongoDB
         logger.info("Connecting to MongoDB...")
@@ -196,14 +548,42 @@ if __name__ == '__main__':
         logger.warning(f"MongoDB connection failed: {e}")
         logger.warning("Server will start without database. Some features may not work.")
     
-    # Load ML model
-    logger.info("Loading ML model...")
-    load_model()
+    if serving_process:
+        # Record predictions in crop_health without blocking requests
+        rollup_counters.start()
+        start_history_writer()
+        # Remove deleted posts' comments, likes and saves off the request path
+        post_cascade.start()
+        # Write like/comment counters in coalesced batches
+        post_counters.start()
+        # Load ML model in the background so /api routes serve immediately
+        logger.info("Loading ML model in background...")
+        start_model_loader()
     
-    logger.info("Starting server on http://localhost:5000")
+    logger.info(f"Starting server on http://localhost:5000 ({Config.SERVING_MODE} mode)")
     try:
-        app.run(host='0.0.0.0', port=5000, debug=True)
+        if production:
+            try:
+                from waitress import serve
+            except ImportError:
+                serve = None
+            if serve is not None:
+                serve(app, host='0.0.0.0', port=5000, threads=Config.HTTP_THREADS)
+            else:
+                app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+        else:
+            app.run(host='0.0.0.0', port=5000, debug=debug)
     finally:
+        if batch_scheduler is not None:
+            batch_scheduler.stop()
+        if inference_pool is not None:
+            inference_pool.shutdown()
+        # Write queued diagnoses before the connection goes away
+        if history_writer is not None:
+            history_writer.stop()
+        post_cascade.stop()
+        # Write buffered counter changes before the connection goes away
+        post_counters.stop()
+        rollup_counters.stop()
         # Close database connection on shutdown
         close_connection()
-
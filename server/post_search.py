@@ -0,0 +1,83 @@
+"""
+Search over community posts
+
+Two query shapes, each served by its own index on posts:
+
+  q=...      full-text search on content through the text index, ranked by
+             relevance (textScore); equal scores in _id order, newest first
+  tags=a,b   posts carrying every listed tag, newest first, through the
+             multikey (tags, timestamp, _id) index
+
+location= narrows either shape to one location, and q and tags can be
+combined. Deleted posts are never returned. Pages are cut with the same
+opaque cursors as the feed (see pagination.py); relevance pages seek on
+(score, _id).
+
+search() is a generator that yields its MongoDB call (see api_core).
+"""
+from api_core import to_list
+from cascade_deletes import LIVE
+from pagination import paginate, keyset_filter, encode_cursor
+
+MAX_QUERY_LENGTH = 200
+MAX_TAGS = 10
+
+
+class InvalidSearchError(ValueError):
+    """Raised for a search request that can't be served from an index"""
+    pass
+
+
+def parse_search_args(args):
+    """(q, tags, location) from query parameters, validated"""
+    q = ' '.join(args.get('q', '').split())
+    if len(q) > MAX_QUERY_LENGTH:
+        raise InvalidSearchError(f"q must be at most {MAX_QUERY_LENGTH} characters")
+    tags = []
+    for tag in args.get('tags', '').split(','):
+        tag = tag.strip()
+        if tag and tag not in tags:
+            tags.append(tag)
+    if len(tags) > MAX_TAGS:
+        raise InvalidSearchError(f"At most {MAX_TAGS} tags")
+    if not q and not tags:
+        # location alone has no index to use
+        raise InvalidSearchError('q or tags is required')
+    location = args.get('location', '').strip() or None
+    return q, tags, location
+
+
+def search(collection, q, tags=(), location=None, limit=20, cursor=None, projection=None):
+    """Fetch one page of matching posts; returns (posts, next cursor or None)
+
+    With q, posts carry their relevance as 'score', and projection must
+    include it (parse_fields(..., sort_field='score')).
+    """
+    match = dict(LIVE)
+    if tags:
+        match['tags'] = tags[0] if len(tags) == 1 else {'$all': list(tags)}
+    if location:
+        match['location'] = location
+
+    if not q:
+        return (yield from paginate(
+            collection, match, 'timestamp', -1, limit, cursor=cursor, projection=projection
+        ))
+
+    match['$text'] = {'$search': q}
+    pipeline = [
+        {'$match': match},
+        {'$addFields': {'score': {'$meta': 'textScore'}}},
+    ]
+    if cursor:
+        pipeline.append({'$match': keyset_filter('score', -1, cursor)})
+    # The limit is folded into the sort, which keeps only the top results
+    pipeline.append({'$sort': {'score': -1, '_id': -1}})
+    pipeline.append({'$limit': limit + 1})
+    if projection:
+        pipeline.append({'$project': projection})
+    docs = yield to_list(collection.aggregate(pipeline))
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], 'score')
@@ -0,0 +1,59 @@
+"""
+Field projections for list routes
+
+List routes accept a fields= query parameter, pushed down into find() so
+MongoDB only sends the requested fields:
+
+  fields=summary         the lean view for list screens (SUMMARY_FIELDS)
+  fields=id,likes,tags   an explicit comma-separated list of fields
+  (absent) or full       whole documents, as before
+"""
+import re
+
+# Lean views per collection. Posts drop the inline image and bookkeeping
+# timestamps; crop-health entries keep only the top diagnosis.
+SUMMARY_FIELDS = {
+    'posts': {
+        'id': 1, 'authorId': 1, 'author': 1, 'content': 1, 'location': 1,
+        'tags': 1, 'likes': 1, 'comments': 1, 'timestamp': 1,
+    },
+    'comments': {'id': 1, 'userId': 1, 'userName': 1, 'content': 1, 'timestamp': 1},
+    'activities': {'id': 1, 'type': 1, 'crop': 1, 'timestamp': 1},
+    'chat_messages': {'id': 1, 'userId': 1, 'userName': 1, 'content': 1, 'timestamp': 1},
+    'crop_health': {'id': 1, 'results': {'$slice': 1}, 'location': 1, 'timestamp': 1},
+}
+
+MAX_FIELDS = 32
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$')
+
+
+class InvalidFieldsError(ValueError):
+    """Raised when a client sends an unusable fields= parameter"""
+    pass
+
+
+def parse_fields(collection, fields, sort_field=None):
+    """Build the find() projection for a fields= value, or None for whole documents
+
+    The sort field is always included (and _id is by default) so cursor
+    pagination keeps working whatever the client asks for.
+    """
+    if not fields or fields == 'full':
+        return None
+    if fields == 'summary':
+        projection = dict(SUMMARY_FIELDS[collection])
+        if sort_field:
+            projection[sort_field] = 1
+    else:
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        if not names or len(names) > MAX_FIELDS:
+            raise InvalidFieldsError(f"fields must list between 1 and {MAX_FIELDS} field names")
+        for name in names:
+            # Rejects $-operators and anything else that isn't a plain field path
+            if not FIELD_NAME.match(name):
+                raise InvalidFieldsError(f"Invalid field name: {name}")
+        if sort_field:
+            names.append(sort_field)
+        # A parent path already includes its children; listing both is a path collision
+        projection = {n: 1 for n in names if not any(n.startswith(p + '.') for p in names)}
+    return projection
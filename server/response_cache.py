@@ -0,0 +1,101 @@
+"""
+Server-side response cache with ETags for hot API reads
+
+Cached views are tagged with the resources they read ('feed', 'post:<id>').
+Write routes invalidate those tags after they change MongoDB. Invalidation
+bumps a generation counter that is part of every cache key, so entries
+filled before the write can never be served after it, even if the read
+raced the write.
+
+The ETag is a digest of the response body. It therefore changes whenever
+any field changes (updatedAt, counters, a new comment), and every instance
+computes the same ETag for the same content. If-None-Match is answered with
+304 whether or not the entry was cached.
+
+Cached handlers are api_core generators, so the cache works unchanged under
+both the Flask and the ASGI server.
+"""
+import functools
+import hashlib
+import threading
+import zlib
+
+from api_core import request, normalize_result
+from cache import LRUCache
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches etag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """LRU cache of GET response bodies keyed by URL and tag generations"""
+
+    def __init__(self, maxsize=1024, ttl=60, stripes=4096):
+        self.enabled = maxsize > 0
+        self._entries = LRUCache(maxsize=max(1, maxsize), ttl=ttl)
+        # Tags hash onto a fixed number of generation slots so memory stays
+        # bounded however many posts are touched; a collision only
+        # invalidates a little more than necessary
+        self._generations = [0] * stripes
+        self._lock = threading.Lock()
+        self.not_modified = 0
+
+    def _slot(self, tag):
+        return zlib.crc32(tag.encode()) % len(self._generations)
+
+    def invalidate(self, *tags):
+        """Make every cached response that read any of tags stale"""
+        with self._lock:
+            for tag in tags:
+                self._generations[self._slot(tag)] += 1
+
+    def cached(self, *tags):
+        """Decorator for GET handlers; tags are formatted with the view arguments"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                key = entry = None
+                if self.enabled:
+                    resolved = [tag.format(**kwargs) for tag in tags]
+                    # Read generations before the view queries MongoDB
+                    with self._lock:
+                        generations = tuple(self._generations[self._slot(tag)] for tag in resolved)
+                    key = (request.full_path, generations)
+                    entry = self._entries.get(key)
+                if entry is None:
+                    body, status, headers = normalize_result((yield from view(**kwargs)))
+                    if status != 200:
+                        return body, status, headers
+                    entry = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+                    if key is not None:
+                        self._entries.set(key, entry)
+                return self._conditional(*entry)
+            return wrapper
+        return decorator
+
+    def _conditional(self, body, etag):
+        # Clients may keep the response but must revalidate before reuse
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            with self._lock:
+                self.not_modified += 1
+            return b'', 304, headers
+        return body, 200, headers
+
+    def stats(self):
+        stats = self._entries.stats()
+        stats['enabled'] = self.enabled
+        stats['not_modified'] = self.not_modified
+        return stats
@@ -0,0 +1,174 @@
+"""
+Index audit for the API's query shapes
+
+Usage:
+    MONGODB_URI=mongodb://localhost:27017/ DATABASE_NAME=farmsphere \\
+        python scripts/audit_indexes.py [--migrate] [--max-ratio 2.0]
+
+Runs explain('executionStats') for the query each route in api_routes.py
+issues and reports, per query, the winning plan's index and any problems:
+
+  COLLSCAN   the query reads the whole collection
+  SORT       results are sorted in memory instead of read in index order
+  RATIO      documents examined per document returned is above --max-ratio
+
+Point it at a local mongod holding representative data; on an empty
+collection every plan looks cheap. With --migrate, pending migrations from
+migrations.py are applied first. Exits non-zero if any query has a problem.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from config import Config
+from database import connect_to_database
+from migrations import applied_versions
+from pagination import keyset_filter, encode_cursor
+from cascade_deletes import LIVE, TOMBSTONED
+
+SAMPLE_USER = 'audit-user'
+SAMPLE_POST = 'audit-post'
+SAMPLE_CHAT = 'audit-chat'
+SAMPLE_QUERY = 'blight'
+SAMPLE_TAG = 'tomato'
+SAMPLE_LABEL = 'Tomato___Late_blight'
+SAMPLE_LOCATION = 'Nashik'
+PAGE = 20
+
+
+def after(field, direction, value):
+    """The extra filter paginate() adds when a cursor is passed"""
+    cursor = encode_cursor({field: value, '_id': ObjectId()}, field)
+    return keyset_filter(field, direction, cursor)
+
+
+def route_queries():
+    """(route, collection, filter, sort, limit) for every read the API issues"""
+    now = datetime.utcnow()
+    return [
+        ('GET /users/<id>', 'users', {'userId': SAMPLE_USER}, None, 1),
+        ('GET /posts', 'posts', LIVE, [('timestamp', -1), ('_id', -1)], PAGE + 1),
+        ('GET /posts?cursor', 'posts', {'$and': [LIVE, after('timestamp', -1, now)]},
+         [('timestamp', -1), ('_id', -1)], PAGE + 1),
+        ('GET /posts/<id>', 'posts', dict(LIVE, id=SAMPLE_POST), None, 1),
+        ('GET /posts/search?q', 'posts', dict(LIVE, **{'$text': {'$search': SAMPLE_QUERY}}), None, 0),
+        ('GET /posts/search?tags', 'posts', dict(LIVE, tags=SAMPLE_TAG),
+         [('timestamp', -1), ('_id', -1)], PAGE + 1),
+        ('GET /posts/<id>/comments', 'comments', {'postId': SAMPLE_POST}, [('timestamp', 1)], 0),
+        ('GET /posts/<id>/likes', 'post_likes', {'postId': SAMPLE_POST}, None, 0),
+        ('POST /posts/<id>/like', 'post_likes', {'postId': SAMPLE_POST, 'userId': SAMPLE_USER}, None, 1),
+        ('POST /posts/<id>/save', 'saved_posts', {'postId': SAMPLE_POST, 'userId': SAMPLE_USER}, None, 1),
+        # The saved-posts pipeline's $match/$sort/$limit, then its $lookup per save
+        ('GET /users/<id>/saved-posts', 'saved_posts', {'userId': SAMPLE_USER},
+         [('createdAt', -1), ('_id', -1)], PAGE + 1),
+        ('GET /users/<id>/saved-posts?cursor', 'saved_posts',
+         {'$and': [{'userId': SAMPLE_USER}, after('createdAt', -1, now)]},
+         [('createdAt', -1), ('_id', -1)], PAGE + 1),
+        ('GET /users/<id>/saved-posts (lookup)', 'posts', {'id': SAMPLE_POST}, None, 0),
+        ('GET /users/<id>/activities', 'activities', {'userId': SAMPLE_USER},
+         [('timestamp', -1), ('_id', -1)], PAGE + 1),
+        ('GET /users/<id>/activities?cursor', 'activities',
+         {'$and': [{'userId': SAMPLE_USER}, after('timestamp', -1, now)]},
+         [('timestamp', -1), ('_id', -1)], PAGE + 1),
+        ('GET /chats/<id>/messages', 'chat_messages', {'chatId': SAMPLE_CHAT},
+         [('timestamp', 1), ('_id', 1)], 50 + 1),
+        ('GET /chats/<id>/messages?cursor', 'chat_messages',
+         {'$and': [{'chatId': SAMPLE_CHAT}, after('timestamp', 1, now)]},
+         [('timestamp', 1), ('_id', 1)], 50 + 1),
+        ('GET /users/<id>/crop-health', 'crop_health', {'userId': SAMPLE_USER},
+         [('timestamp', -1), ('_id', -1)], PAGE + 1),
+        ('GET /users/<id>/crop-health?cursor', 'crop_health',
+         {'$and': [{'userId': SAMPLE_USER}, after('timestamp', -1, now)]},
+         [('timestamp', -1), ('_id', -1)], PAGE + 1),
+        ('GET /disease-prevalence', 'disease_rollups', {'day': {'$gte': now - timedelta(days=30), '$lte': now}},
+         None, 0),
+        ('GET /disease-prevalence?label', 'disease_rollups',
+         {'day': {'$gte': now - timedelta(days=30), '$lte': now}, 'label': SAMPLE_LABEL}, None, 0),
+        ('GET /disease-prevalence?location', 'disease_rollups',
+         {'day': {'$gte': now - timedelta(days=30), '$lte': now}, 'location': SAMPLE_LOCATION}, None, 0),
+        # Background cascade after DELETE /posts/<id>, and its periodic sweep
+        ('cascade delete (comments)', 'comments', {'postId': SAMPLE_POST}, None, Config.CASCADE_CHUNK_SIZE),
+        ('cascade delete (likes)', 'post_likes', {'postId': SAMPLE_POST}, None, Config.CASCADE_CHUNK_SIZE),
+        ('cascade delete (saves)', 'saved_posts', {'postId': SAMPLE_POST}, None, Config.CASCADE_CHUNK_SIZE),
+        ('cascade sweep (tombstones)', 'posts', {'deletedAt': {'$lt': now}}, None, 0),
+        ('GET /posts total (tombstones)', 'posts', TOMBSTONED, None, 0),
+    ]
+
+
+def plan_stages(plan):
+    """Yield every stage in a (possibly nested) query plan"""
+    yield plan
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from plan_stages(child)
+
+
+def explain(db, collection, query, sort, limit):
+    command = {'find': collection, 'filter': query}
+    if sort:
+        command['sort'] = dict(sort)
+    if limit:
+        command['limit'] = limit
+    return db.command('explain', command, verbosity='executionStats')
+
+
+def audit(db, max_ratio):
+    problems = 0
+    for route, collection, query, sort, limit in route_queries():
+        result = explain(db, collection, query, sort, limit)
+        stages = list(plan_stages(result['queryPlanner']['winningPlan']))
+        names = {stage.get('stage') for stage in stages}
+        indexes = sorted({stage['indexName'] for stage in stages if 'indexName' in stage})
+
+        stats = result['executionStats']
+        returned = stats['nReturned']
+        examined = max(stats['totalDocsExamined'], stats['totalKeysExamined'])
+        ratio = examined / max(returned, 1)
+
+        issues = []
+        if 'COLLSCAN' in names:
+            issues.append('COLLSCAN')
+        if 'SORT' in names:
+            issues.append('SORT')
+        if ratio > max_ratio:
+            issues.append(f"RATIO {ratio:.1f}")
+        problems += bool(issues)
+
+        print(
+            f"{'FAIL' if issues else 'ok':4}  {route:40} {collection:14} "
+            f"index={','.join(indexes) or '-':32} examined={examined} returned={returned}"
+            + (f"  [{' '.join(issues)}]" if issues else '')
+        )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--migrate', action='store_true', help='apply pending index migrations first')
+    parser.add_argument('--max-ratio', type=float, default=2.0,
+                        help='largest acceptable examined/returned ratio')
+    args = parser.parse_args()
+
+    if args.migrate:
+        # Creates indexes and applies pending migrations, as the server does at startup
+        db = connect_to_database()
+        print(f"Applied migrations: {sorted(applied_versions(db))}")
+    else:
+        # Connect without create_indexes() so the audit sees the indexes as deployed
+        db = MongoClient(Config.MONGODB_URI, serverSelectionTimeoutMS=5000)[Config.DATABASE_NAME]
+
+    problems = audit(db, args.max_ratio)
+    print(f"\n{problems} of {len(route_queries())} queries need attention")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
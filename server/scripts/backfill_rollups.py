@@ -0,0 +1,56 @@
+"""
+Backfill disease prevalence rollups from crop_health history
+
+Usage:
+    MONGODB_URI=mongodb://localhost:27017/ DATABASE_NAME=farmsphere \\
+        python scripts/backfill_rollups.py [--from 2024-01-01] [--to 2026-01-01]
+
+Recomputes the disease_rollups documents of every day in [--from, --to)
+from the diagnoses stored in crop_health, writing the totals over what is
+there. Without --from all history is rebuilt; --to defaults to today, so
+today's rollups, which the servers are still updating, are left alone. Run
+it once after deploying the rollups and again whenever counts need
+reconciling; it reads the range in one pass and can run while the servers
+do. Rollups that offline uploads update while it runs, or that count a
+diagnosis stored in the last --settle seconds (its change may not be
+flushed yet), are left as they were and reported; run it again later to
+reconcile them.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import connect_to_database
+from disease_rollups import rebuild
+
+
+def parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--from', dest='start', type=parse_day, help='first day to rebuild (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='end', type=parse_day, help='day after the last one to rebuild')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--settle', type=float, default=60.0,
+                        help='seconds a stored diagnosis needs to reach its rollup (default 60)')
+    args = parser.parse_args()
+
+    db = connect_to_database()
+    started = time.perf_counter()
+    read, written, skipped = rebuild(
+        db, args.start, args.end, batch_size=args.batch_size, settle=args.settle
+    )
+    print(f"Read {read} diagnoses, wrote {written} rollups in {time.perf_counter() - started:.1f}s")
+    if skipped:
+        print(f"{skipped} rollups were updated by the servers meanwhile, or count recent diagnoses, "
+              f"and were left as they were; run again later to reconcile them")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Convert the Keras plant disease model to a quantized TFLite model
+
+Usage:
+    python scripts/convert_to_tflite.py --quantization float16 --samples path/to/leaf_images
+    python scripts/convert_to_tflite.py --quantization int8 --samples path/to/leaf_images
+
+float16 stores weights as half precision. int8 quantizes weights and
+activations, calibrated on the sample images; inputs and outputs stay float32
+so the server's predict contract is unchanged.
+
+After converting, the script runs both models over the sample set and reports
+top-1 agreement with the Keras model and per-image latency for each backend.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from image_decode import decode_image
+from inference_backend import (
+    QUANTIZATION_MODES, KerasBackend, TFLiteBackend,
+    find_keras_model_path, default_tflite_path
+)
+
+
+def load_samples(path, limit):
+    """Decode and preprocess sample images exactly as the server does"""
+    import tensorflow as tf
+
+    arrays = []
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            if not name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+                continue
+            with open(os.path.join(root, name), 'rb') as f:
+                try:
+                    arrays.append(decode_image(f.read()))
+                except ValueError as e:
+                    print(f"Skipping {name}: {e}")
+            if len(arrays) >= limit:
+                break
+        if len(arrays) >= limit:
+            break
+    if not arrays:
+        return None
+    return tf.keras.applications.efficientnet.preprocess_input(np.stack(arrays, axis=0))
+
+
+def convert(keras_model, quantization, samples):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        if samples is None:
+            raise SystemExit('int8 quantization needs --samples for calibration')
+
+        def representative_dataset():
+            for i in range(len(samples)):
+                yield [samples[i:i + 1].astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    return converter.convert()
+
+
+def evaluate(keras_backend, tflite_backend, samples):
+    """Compare top-1 predictions and single-image latency"""
+    agree = 0
+    keras_ms = []
+    tflite_ms = []
+    for i in range(len(samples)):
+        image = samples[i:i + 1]
+
+        start = time.perf_counter()
+        keras_out = keras_backend.predict(image)
+        keras_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        tflite_out = tflite_backend.predict(image)
+        tflite_ms.append((time.perf_counter() - start) * 1000)
+
+        agree += int(np.argmax(keras_out[0]) == np.argmax(tflite_out[0]))
+
+    # The first call includes one-off setup; leave it out of the latency figures
+    keras_ms = keras_ms[1:] or keras_ms
+    tflite_ms = tflite_ms[1:] or tflite_ms
+    print(f"Samples:          {len(samples)}")
+    print(f"Top-1 agreement:  {agree / len(samples):.2%} ({agree}/{len(samples)})")
+    print(f"Keras latency:    p50 {np.percentile(keras_ms, 50):7.2f} ms   p95 {np.percentile(keras_ms, 95):7.2f} ms")
+    print(f"TFLite latency:   p50 {np.percentile(tflite_ms, 50):7.2f} ms   p95 {np.percentile(tflite_ms, 95):7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quantization', choices=QUANTIZATION_MODES, default='float16')
+    parser.add_argument('--samples', help='directory of leaf images for calibration and evaluation')
+    parser.add_argument('--limit', type=int, default=200, help='max sample images to use')
+    parser.add_argument('--output', help='output .tflite path')
+    args = parser.parse_args()
+
+    keras_path = find_keras_model_path()
+    output = args.output or default_tflite_path(args.quantization)
+
+    samples = load_samples(args.samples, args.limit) if args.samples else None
+
+    keras_backend = KerasBackend(keras_path)
+    print(f"Converting {keras_path} ({args.quantization})...")
+    tflite_model = convert(keras_backend.model, args.quantization, samples)
+    with open(output, 'wb') as f:
+        f.write(tflite_model)
+    print(f"Wrote {os.path.abspath(output)} ({len(tflite_model) / 1024 / 1024:.1f} MiB, "
+          f"Keras file {os.path.getsize(keras_path) / 1024 / 1024:.1f} MiB)")
+
+    if samples is None:
+        print('No --samples given; skipping agreement and latency report')
+        return 0
+
+    evaluate(keras_backend, TFLiteBackend(output), samples)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
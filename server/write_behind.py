@@ -0,0 +1,155 @@
+"""
+Write-behind queue for MongoDB inserts
+
+Documents are queued in memory and written by a background thread in
+batches with insert_many, so request latency never waits on MongoDB.
+"""
+import queue
+import threading
+import time
+import logging
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """Bounded in-memory queue that batches inserts into one collection
+
+    When the queue is full, enqueue() blocks for up to put_timeout seconds
+    (backpressure on the caller) and then gives up, returning False.
+    on_written(docs) is called after each batch with the documents that
+    were actually inserted.
+    """
+
+    def __init__(self, get_collection, batch_size=100, flush_interval=1.0,
+                 max_queue=10000, put_timeout=0.05, max_retries=3, on_written=None):
+        self.get_collection = get_collection
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.on_written = on_written
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        """Start the background writer thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, doc):
+        """Queue a document for insertion; returns False if the queue stayed full"""
+        try:
+            self._queue.put(doc, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning("Write-behind queue full, dropping document")
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def flush(self, timeout=10.0):
+        """Wait until every queued document has been written (or failed)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self._queue.unfinished_tasks == 0
+
+    def stop(self, timeout=10.0):
+        """Flush outstanding documents and stop the writer thread"""
+        if self._thread is None:
+            return
+        flushed = self.flush(timeout)
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        if not flushed:
+            logger.warning(f"Write-behind stopped with {self._queue.qsize()} documents unwritten")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches,
+            }
+
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        docs = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(docs) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                docs.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return docs
+
+    def _run(self):
+        while not self._stop.is_set():
+            docs = self._collect()
+            if not docs:
+                continue
+            try:
+                self._write(docs)
+            except Exception as e:
+                logger.error(f"Write-behind batch of {len(docs)} failed: {e}")
+                with self._lock:
+                    self.failed += len(docs)
+            finally:
+                for _ in docs:
+                    self._queue.task_done()
+
+    def _write(self, docs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.get_collection().insert_many(docs, ordered=False)
+                inserted = docs
+                break
+            except BulkWriteError as e:
+                # Unordered: everything except the reported errors was inserted
+                errors = e.details.get('writeErrors', [])
+                failed = {error['index'] for error in errors}
+                inserted = [doc for i, doc in enumerate(docs) if i not in failed]
+                logger.warning(f"Write-behind batch had {len(errors)} errors")
+                break
+            except PyMongoError as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Write-behind batch of {len(docs)} failed: {e}")
+                    with self._lock:
+                        self.failed += len(docs)
+                    return
+                time.sleep(min(2 ** attempt * 0.5, 5.0))
+
+        with self._lock:
+            self.written += len(inserted)
+            self.failed += len(docs) - len(inserted)
+            self.batches += 1
+        if self.on_written is not None and inserted:
+            try:
+                self.on_written(inserted)
+            except Exception as e:
+                logger.warning(f"Write-behind callback failed: {e}")